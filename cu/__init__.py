@@ -25,6 +25,9 @@ from cu.decorators import task
 
 from cu.exceptions import TASK_RUNNING, NOT_IN_STORAGE
 
+# connects worker signals
+import cu.storage.prefetch
+
 from cu.webserver.upload import upload, download
 
 CELERY_APP.autodiscover_tasks(CONFIGS['app']['autodiscover'])
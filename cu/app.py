@@ -25,6 +25,9 @@ import logging
 from cu.configs.configs \
     import read_config_wrt_git
 
+from cu.local.configs \
+    import local_root, local_configs, LOCAL_CELERY_CONF
+
 from cu.utils.redis.dictionary \
     import Redis_Dictionary
 
@@ -50,6 +53,13 @@ def _set_localmount(configs, allowed_remote):
 
 _GITROOT, CONFIGS = read_config_wrt_git()
 
+# CU_LOCAL_MODE runs everything in a single process, see
+# ?cu.local.configs.local_configs
+_LOCAL_MODE = os.environ.get('CU_LOCAL_MODE', '')
+CONFIGS['local_root'] = None
+if _LOCAL_MODE:
+    CONFIGS = local_configs(CONFIGS, local_root(_LOCAL_MODE))
+
 CONFIGS['git_root'] = _GITROOT
 
 CONFIGS['logs_path'] = os.path.join(_GITROOT, CONFIGS['logging']['path'])
@@ -78,6 +88,8 @@ CELERY_APP.autodiscover_tasks(['cu.cache','cu.webserver'])
 CELERY_APP.conf.task_serializer = 'msgpack'
 CELERY_APP.conf.result_serializer = 'msgpack'
 CELERY_APP.conf.accept_content = ['application/json', 'application/x-msgpack']
+if _LOCAL_MODE:
+    CELERY_APP.conf.update(**LOCAL_CELERY_CONF)
 
 ALLOWED_REMOTE = CONFIGS['remotestorage']['use_remotes']
 ALLOWED_REMOTE, _LOCAL_STORAGE_ROOTS = \
@@ -0,0 +1,175 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import celery
+
+from functools import wraps
+
+from cu.exceptions \
+    import TASK_RUNNING
+from cu.storage.get_locally \
+    import _collect, fetch_paths
+from cu.utils import metrics
+from cu.utils.matchargs \
+    import matchargs
+from cu.utils.one_instance \
+    import one_instance
+
+
+def batch_runner(fun, cache = True, get_args_locally = True,
+                 **kwargs):
+    """Make a function that runs many calls of fun at once
+
+    Calls are cached one by one as with ?cu.decorators.task, but the
+    storage is queried once for all calls, and remote arguments of
+    calls that are computed are fetched in parallel.
+
+    Every call is computed under its own ?cu.utils.one_instance lock,
+    the same lock as a single call of the task takes. Hence, a batch
+    and a single call never compute the same call at the same time,
+    and the lock expires as for a single call. Calls that are locked
+    by another task are skipped. Then, after other calls are computed,
+    TASK_RUNNING is raised, and a retry of the batch finds computed
+    calls in the cache.
+
+    :fun: function, possibly wrapped with get_locally
+
+    :cache, get_args_locally: see ?cu.decorators.task
+
+    :kwargs: see ?cu.cache.cache.cache_fn and
+    ?cu.utils.one_instance.one_instance
+
+    :return: function that takes a list of kwargs dictionaries and
+    returns a list of results
+
+    """
+    if cache:
+        from cu.cache.cache import cache_fn
+        cached = matchargs(cache_fn)(**kwargs)(fun)
+
+    def locked(call):
+        # the lock key is computed from the name and the arguments
+        return matchargs(one_instance)(**kwargs)(wraps(fun)(call))
+
+    def compute(calls, rpaths):
+        if get_args_locally:
+            fetch_paths(_collect(calls, set()))
+
+        res, running = [], False
+        for x, r in zip(calls, rpaths):
+            try:
+                if cache:
+                    res += [locked(lambda **x: cached.store(r, **x))(**x)]
+                else:
+                    res += [locked(lambda **x: fun(**x))(**x)]
+            except TASK_RUNNING:
+                running = True
+
+        if running:
+            raise TASK_RUNNING()
+        return res
+
+    def run(calls):
+        if cache:
+            checks = cached.check_many([((), x) for x in calls])
+        else:
+            checks = [(False, None)] * len(calls)
+
+        res = [str(r) if isin else None for isin, r in checks]
+        todo = [i for i, (isin, _) in enumerate(checks) if not isin]
+        if cache:
+            metrics.add('cache_hits', len(calls) - len(todo))
+            metrics.add('cache_misses', len(todo))
+        if not todo:
+            return res
+
+        computed = compute([calls[i] for i in todo],
+                           [checks[i][1] for i in todo])
+
+        for i, x in zip(todo, computed):
+            res[i] = x
+        return res
+
+    return run
+
+
+def batches(batch_task, calls, size):
+    """Make a canvas running calls in batches
+
+    :batch_task: a task made by ?cu.decorators.task with batch > 0
+
+    :calls: list of kwargs dictionaries
+
+    :size: maximum number of calls in a batch
+
+    :return: a celery signature, which result is the list of results
+    of calls
+    """
+    from cu.cache.tasks import join_batches
+
+    if not calls:
+        return join_batches.si(results = [])
+
+    return celery.chord\
+        ([batch_task.signature(kwargs = {'calls': calls[i:i+size]})
+          for i in range(0, len(calls), size)],
+         join_batches.signature())
+
+
+def cached_map(task, calls, size):
+    """Make a canvas mapping a task over calls, skipping cached calls
+
+    Calls are split in chunks of size. The storage is checked for all
+    calls of a chunk at once, and only calls that are not cached are
+    sent to workers in batches, see ?cu.cache.batch.batch_runner.
+
+    :task: a task made by ?cu.decorators.task with batch > 0
+
+    :calls: list of kwargs dictionaries
+
+    :size: number of calls in a chunk
+
+    :return: a celery signature, which result is the list of results
+    of calls
+    """
+    from cu.cache.tasks import fill_results
+
+    results, todo, header = [], [], []
+    for start in range(0, len(calls), size):
+        chunk = calls[start:start+size]
+        if hasattr(task, 'check_many'):
+            checks = task.check_many([((), x) for x in chunk])
+        else:
+            checks = [(False, None)] * len(chunk)
+
+        results += [str(r) if isin else None for isin, r in checks]
+        idx = [start + i for i, (isin, _) in enumerate(checks)
+               if not isin]
+        if not idx:
+            continue
+
+        todo += [idx]
+        header += [task.batch_task.signature\
+                   (kwargs = {'calls': [calls[i] for i in idx]})]
+
+    if not header:
+        return fill_results.si(computed = [], results = results,
+                               todo = [])
+
+    return celery.chord\
+        (header, fill_results.signature\
+         (kwargs = {'results': results, 'todo': todo}))
@@ -0,0 +1,144 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import pytest
+import celery
+
+from cu.app \
+    import CONFIGS
+from cu.exceptions \
+    import TASK_RUNNING
+from cu.utils.float_hash \
+    import float_hash
+from cu.utils.redis.lock \
+    import RedisLock
+
+from . import cache
+from .batch \
+    import batch_runner, batches, cached_map
+
+
+_APP = celery.Celery(set_as_current = False)
+
+
+@_APP.task
+def _batch(calls):
+    return calls
+
+
+class _Task:
+    batch_task = _batch
+
+    def check_many(self, calls):
+        return [(0 == kwargs['x'] % 3, 'cached_{}'.format(kwargs['x']))
+                for _, kwargs in calls]
+
+
+def test_cached_map():
+    calls = [{'x': i} for i in range(8)]
+    canvas = cached_map(_Task(), calls, 3)
+
+    assert isinstance(canvas, celery.chord)
+    assert [[{'x': 1}, {'x': 2}], [{'x': 4}, {'x': 5}], [{'x': 7}]] == \
+        [x.kwargs['calls'] for x in canvas.tasks]
+    assert [[1, 2], [4, 5], [7]] == canvas.body.kwargs['todo']
+    assert ['cached_0', None, None, 'cached_3', None, None,
+            'cached_6', None] == canvas.body.kwargs['results']
+
+    canvas = cached_map(_Task(), [{'x': 0}, {'x': 3}], 3)
+    assert ['cached_0', 'cached_3'] == canvas.kwargs['results']
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    from cu.utils.redis import client
+    monkeypatch.setitem(client._CLIENTS, CONFIGS['broker_url'],
+                        fakeredis.FakeStrictRedis())
+
+
+def _cache_fn(storage):
+    # stores results in a dictionary
+    class Cached:
+
+
+        def __init__(self, fun):
+            self.fun = fun
+
+
+        def check_many(self, calls):
+            return [(kwargs['x'] in storage, 'path_{}'.format(kwargs['x']))
+                    for _, kwargs in calls]
+
+
+        def store(self, rpath, **kwargs):
+            storage[kwargs['x']] = self.fun(**kwargs)
+            return rpath
+
+    return lambda **kwargs: Cached
+
+
+def _fun(computed):
+    def fun(x):
+        computed.append(x)
+        return x*x
+    return fun
+
+
+def test_batch_runner(redis, monkeypatch):
+    storage, computed = {0: 0, 3: 9}, []
+    monkeypatch.setattr(cache, 'cache_fn', _cache_fn(storage))
+    run = batch_runner(_fun(computed), get_args_locally = False)
+
+    assert ['path_{}'.format(i) for i in range(5)] == \
+        run([{'x': i} for i in range(5)])
+    assert [1, 2, 4] == computed
+    assert {i: i*i for i in range(5)} == storage
+
+    computed.clear()
+    run = batch_runner(_fun(computed), cache = False,
+                       get_args_locally = False)
+    assert [9, 1, 9] == run([{'x': 3}, {'x': 1}, {'x': 3}])
+    assert [3, 1, 3] == computed
+
+
+def test_batch_runner_locked(redis, monkeypatch):
+    storage, computed = {}, []
+    monkeypatch.setattr(cache, 'cache_fn', _cache_fn(storage))
+    run = batch_runner(_fun(computed), get_args_locally = False)
+
+    # a single call of fun(x = 2) is running
+    key = float_hash(("one_instance_lock", 'fun', (), {'x': 2}))
+    with RedisLock(redis_url = CONFIGS['broker_url'], key = key):
+        with pytest.raises(TASK_RUNNING):
+            run([{'x': i} for i in range(4)])
+    assert [0, 1, 3] == computed
+
+    assert ['path_{}'.format(i) for i in range(4)] == \
+        run([{'x': i} for i in range(4)])
+    assert [0, 1, 3, 2] == computed
+
+
+def test_batches():
+    canvas = batches(_batch, [{'x': i} for i in range(5)], 2)
+
+    assert isinstance(canvas, celery.chord)
+    assert [[{'x': 0}, {'x': 1}], [{'x': 2}, {'x': 3}], [{'x': 4}]] == \
+        [x.kwargs['calls'] for x in canvas.tasks]
+    assert canvas.body.name.endswith('join_batches')
+
+    assert [] == batches(_batch, [], 2).kwargs['results']
@@ -27,17 +27,25 @@ from cu.exceptions \
     import FILE_DISAPPEARED
 
 from cu.storage.remotestorage_path \
-    import RemoteStoragePath, is_remote_path
+    import RemoteStoragePath, is_remote_path, \
+    get_timestamps, update_timestamps
 
 from cu.utils.files \
     import remove_file, move_file, get_tempfile
+from cu.utils import metrics
+from cu.utils.profile_layers \
+    import layer
+from cu.utils.tracing \
+    import span
 from cu.utils.matchargs \
     import matchargs
 from cu.utils.serialise \
     import serialise, deserialise
 
 from cu.cache.tasks \
-    import call_fn_cache
+    import call_fn_cache, _ofn
+from cu.storage.get_locally \
+    import fetch_paths
 from cu.cache.compute_ofn \
     import compute_ofn
 from cu.cache.ifpass_minage \
@@ -76,31 +84,72 @@ def _check_in_storage(fun, args, kwargs,
     :remotetype, serialise: see ?cu.storage.remotestorage_path.RemoteStoragePath
 
     """
-    ofn = matchargs(compute_ofn)\
-        (fun = fun, args = args, kwargs = kwargs, **ofn_kwargs)
-    ofn_rpath = matchargs(RemoteStoragePath)\
-        (path = ofn, **ofn_kwargs)
-
-    if ofn_rpath.in_storage() and \
-       ifpass_minage(minage = minage,
-                     fntime = ofn_rpath.get_timestamp(),
-                     kwargs = kwargs):
+    with span('cache_check'):
+        with layer('compute_ofn'):
+            ofn = matchargs(compute_ofn)\
+                (fun = fun, args = args, kwargs = kwargs, **ofn_kwargs)
+            ofn_rpath = matchargs(RemoteStoragePath)\
+                (path = ofn, **ofn_kwargs)
+
+        if ofn_rpath.in_storage() and \
+           ifpass_minage(minage = minage,
+                         fntime = ofn_rpath.get_timestamp(),
+                         kwargs = kwargs):
+            if update_timestamp:
+                ofn_rpath.update_timestamp()
+            return True, ofn_rpath
+
+        return False, ofn_rpath
+
+
+def _check_in_storage_many(fun, calls,
+                           minage = None, update_timestamp = True,
+                           **ofn_kwargs):
+    """Check many function calls present in the storage
+
+    As ?cu.cache.cache._check_in_storage, but the storage is queried
+    once for all calls and no locks are taken.
+
+    :calls: list of (args, kwargs)
+
+    :return: list of (isin, ofn_rpath)
+
+    """
+    with span('cache_check', calls = len(calls)):
+        rpaths = [matchargs(RemoteStoragePath)\
+                  (path = matchargs(compute_ofn)\
+                   (fun = fun, args = args, kwargs = kwargs, **ofn_kwargs),
+                   **ofn_kwargs)
+                  for args, kwargs in calls]
+
+        isin = [fntime is not None and \
+                ifpass_minage(minage = minage, fntime = fntime,
+                              kwargs = kwargs)
+                for fntime, (_, kwargs) in \
+                zip(get_timestamps(rpaths), calls)]
+
         if update_timestamp:
-            ofn_rpath.update_timestamp()
-        return True, ofn_rpath
+            update_timestamps([x for x, y in zip(rpaths, isin) if y])
 
-    return False, ofn_rpath
+        return list(zip(isin, rpaths))
 
 
 def cache_fn(return_type = 'path', remove_return = True,
-             ignore = lambda x: False, **cache_kwargs):
+             ignore = lambda x: False, direct_write = False,
+             **cache_kwargs):
     """Cache results of a function that returns a file
 
     :return_type: what to expect from the function
           - 'path' expects a path
           - 'pickle' expects a pickle-serialisable object
+          - 'pickle5' as 'pickle', but large buffers are stored
+            out-of-band and read back without a copy, see
+            ?cu.utils.pickle5_serialiser.dump
           - 'json' expects a json-serialisable object
           - 'msgpack' expects a msgpack-serialisable object
+          - 'numpy' expects an array or a dictionary of arrays.
+            Arrays are read back memory-mapped, see
+            ?cu.utils.numpy_serialiser.load
 
     :remove_return: if True, then return filename from the function is
     considered to be temporary and removed. if 'path' != return_type,
@@ -109,11 +158,19 @@ def cache_fn(return_type = 'path', remove_return = True,
     :ignore: a boolean function that is computed if result of a
     function should be ignored.
 
+    :direct_write: if True and 'path' != return_type, the result is
+    serialised straight into the storage (see
+    ?cu.storage.remotestorage_path.RemoteStoragePath.upload_data),
+    instead of being written to a temporary file that is moved to the
+    local cache and uploaded. Note, ignore is then computed on the
+    result itself, and not on the serialised file.
+
     :cache_kwargs: see ?cu.cache.cache._check_in_storage
 
     """
     def wrapper(fun):
-        if 'path' != return_type:
+        if_serialise = 'path' != return_type and not direct_write
+        if if_serialise:
             fun = serialise(how = return_type)(fun)
 
         @wraps(fun)
@@ -124,13 +181,24 @@ def cache_fn(return_type = 'path', remove_return = True,
                  serialise = return_type, **cache_kwargs)
 
             if isin:
+                metrics.add('cache_hits')
                 return str(ofn_rpath)
 
+            metrics.add('cache_misses')
+            return store(ofn_rpath, *args, **kwargs)
+
+        def store(ofn_rpath, *args, **kwargs):
+            """Compute the function and store the result to ofn_rpath
+            """
             tfn = fun(*args, **kwargs)
 
             if ignore(tfn):
                 return tfn
 
+            if 'path' != return_type and not if_serialise:
+                ofn_rpath.upload_data(tfn)
+                return str(ofn_rpath)
+
             tfn_rpath = RemoteStoragePath(tfn)
 
             if is_remote_path(tfn):
@@ -148,9 +216,21 @@ def cache_fn(return_type = 'path', remove_return = True,
             ofn_rpath.upload()
             return str(ofn_rpath)
 
+        def check_many(calls):
+            """Check many calls present in the storage
+
+            see ?cu.cache.cache._check_in_storage_many
+            """
+            return matchargs(_check_in_storage_many)\
+                (fun = fun, calls = calls,
+                 serialise = return_type, **cache_kwargs)
+
+        wrap.store = store
+        wrap.check_many = check_many
         wrap._cache_args = \
             {'return_type': return_type,
-             'remove_return': remove_return}
+             'remove_return': remove_return,
+             'direct_write': direct_write}
         wrap._cache_args.update\
             (_function_defaults\
              (_check_in_storage, **cache_kwargs))
@@ -193,6 +273,76 @@ def cache_call(call_serialiser = 'msgpack', cache_result = True, **cache_kwargs)
             (return_type=call_serialiser, ofn_arg='ofn',
              **cache_kwargs)(_save_call)
 
+        # '*_meta' contains some meta information about the call:
+        # how to serialise the result.
+        def meta(ofn_rpath):
+            return matchargs(RemoteStoragePath)\
+                (path = ofn_rpath.path + '_meta',
+                 serialise = call_serialiser, **cache_kwargs)
+
+        def cached_result(*args, **kwargs):
+            """Look up the cached result of the call
+
+            Nothing is computed or sent to the broker.
+
+            :return: remote storage path of the result, or None if the
+            result is not in the storage
+            """
+            if not cache_result:
+                return None
+
+            isin, ofn_rpath = \
+                matchargs(_check_in_storage)\
+                (fun = fun, args = args, kwargs = kwargs,
+                 **cache_kwargs)
+            if not isin:
+                return None
+
+            meta_fn = meta(ofn_rpath)
+            if not meta_fn.in_storage():
+                return None
+
+            return _ofn(meta_fn, ofn_rpath.path)
+
+        def cached_results(calls, update_timestamp = True):
+            """Look up cached results of many calls at once
+
+            As ?cached_result, but the storage is queried once for all
+            calls and no locks are taken, see
+            ?cu.cache.cache._check_in_storage_many. Meta files of
+            found results are fetched in parallel, see
+            ?cu.storage.get_locally.fetch_paths
+
+            :calls: list of kwargs dictionaries
+
+            :update_timestamp: if False, timestamps of found results
+            are not updated, even if cache_kwargs asks for it
+
+            :return: list of remote storage paths or None
+            """
+            res = [None] * len(calls)
+            if not cache_result or not calls:
+                return res
+
+            check_kwargs = dict(cache_kwargs)
+            if not update_timestamp:
+                check_kwargs['update_timestamp'] = False
+
+            checks = matchargs(_check_in_storage_many)\
+                (fun = fun, calls = [((), x) for x in calls],
+                 **check_kwargs)
+            idx = [i for i, (isin, _) in enumerate(checks) if isin]
+            metas = [meta(checks[i][1]) for i in idx]
+            found = [(i, str(meta_fn)) for i, meta_fn, fntime in \
+                     zip(idx, metas, get_timestamps(metas))
+                     if fntime is not None]
+            local, _ = fetch_paths([x for _, x in found])
+            for i, meta_fn in found:
+                res[i] = str(RemoteStoragePath\
+                             (checks[i][1].path,
+                              serialise = local[meta_fn]['serialise']))
+            return res
+
         @wraps(fun)
         def wrap(*args, **kwargs):
             isin, ofn_rpath = \
@@ -200,11 +350,7 @@ def cache_call(call_serialiser = 'msgpack', cache_result = True, **cache_kwargs)
                 (fun = fun, args = args, kwargs = kwargs,
                  **cache_kwargs)
 
-            # '*_meta' contains some meta information about the call:
-            # how to serialise the result.
-            meta_fn = matchargs(RemoteStoragePath)\
-                (path = ofn_rpath.path + '_meta',
-                 serialise = call_serialiser, **cache_kwargs)
+            meta_fn = meta(ofn_rpath)
             if cache_result and isin and meta_fn.in_storage():
                 # at this point meta_fn must exist!
                 return call_fn_cache.signature\
@@ -245,5 +391,7 @@ def cache_call(call_serialiser = 'msgpack', cache_result = True, **cache_kwargs)
         wrap._cache_args.update\
             (_function_defaults\
              (_check_in_storage, **cache_kwargs))
+        wrap.cached_result = cached_result
+        wrap.cached_results = cached_results
         return wrap
     return wrapper
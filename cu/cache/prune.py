@@ -0,0 +1,163 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import celery
+
+from celery.canvas \
+    import Signature, _chain, group, chord
+
+from cu.app \
+    import CELERY_APP
+
+
+def _signature(sig):
+    if isinstance(sig, Signature):
+        return sig
+
+    return celery.signature(sig)
+
+
+def _candidate(sig, has_input):
+    """Check if a signature may be replaced by its cached result
+
+    Only signatures of cached tasks (see ?cu.decorators.task), which
+    arguments are fully known before the dispatch, qualify.
+    """
+    if has_input and not sig.immutable:
+        return False
+
+    if sig.options.get('link') or sig.options.get('link_error'):
+        return False
+
+    task = CELERY_APP.tasks.get(sig.task)
+    return task is not None and hasattr(task, 'check_many')
+
+
+def _header(sig):
+    if isinstance(sig.tasks, group):
+        return sig.tasks
+    return group(sig.tasks)
+
+
+def _walk(sig, has_input, visit):
+    """Walk the canvas and call visit(signature, has_input)
+
+    :return: canvas with signatures replaced by values of visit
+    """
+    sig = _signature(sig)
+
+    if isinstance(sig, chord):
+        header = _walk(_header(sig), has_input, visit)
+        body = _walk(sig.body, True, visit)
+        if _const(header)[1]:
+            return _chain(header, body, **sig.options)
+        return chord(header, body, **sig.options)
+
+    if isinstance(sig, group):
+        tasks = [_walk(x, has_input, visit) for x in sig.tasks]
+        values = [_const(x) for x in tasks]
+        if tasks and all(isconst for _, isconst in values):
+            from cu.cache.tasks import constant
+            return constant.si(value = [x for x, _ in values])
+        return group(*tasks, **sig.options)
+
+    if isinstance(sig, _chain):
+        tasks = [_walk(x, has_input or i > 0, visit)
+                 for i, x in enumerate(sig.tasks)]
+        if all(_const(x)[1] for x in tasks):
+            return tasks[-1]
+        return _chain(*tasks, **sig.options)
+
+    return visit(sig, has_input)
+
+
+def _const(sig):
+    from cu.cache.tasks import constant
+
+    if sig.task != constant.name:
+        return None, False
+
+    return sig.kwargs['value'], True
+
+
+def _cached(candidates):
+    """Check candidates in the storage in bulk
+
+    :candidates: list of signatures
+
+    :return: list of cached results, None if not cached
+    """
+    byname = {}
+    for i, x in enumerate(candidates):
+        byname.setdefault(x.task, []).append(i)
+
+    res = [None] * len(candidates)
+    for name, idx in byname.items():
+        checks = CELERY_APP.tasks[name].check_many\
+            ([(tuple(candidates[i].args), dict(candidates[i].kwargs))
+              for i in idx])
+        for i, (isin, rpath) in zip(idx, checks):
+            if isin:
+                res[i] = str(rpath)
+    return res
+
+
+def prune_cached(canvas):
+    """Replace cached tasks of a canvas by their results
+
+    Paths of results of all cached tasks in the canvas are checked in
+    the storage in bulk (see ?cu.cache.cache._check_in_storage_many).
+    A task with the result in the storage is replaced by a task that
+    returns the path, and groups and chains of such tasks are
+    collapsed. Hence, only the tasks that are not cached are sent to
+    workers.
+
+    Only tasks which arguments are known before the dispatch are
+    checked, i.e. tasks that do not receive results of other tasks.
+
+    :canvas: a celery canvas
+
+    :return: a celery canvas
+    """
+    if not isinstance(canvas, (Signature, dict)):
+        return canvas
+
+    candidates = []
+    def collect(sig, has_input):
+        if _candidate(sig, has_input):
+            candidates.append(sig)
+        return sig
+    _walk(canvas, False, collect)
+
+    cached = _cached(candidates)
+    if all(x is None for x in cached):
+        return canvas
+
+    # signatures are visited in the same order
+    cached = iter(cached)
+    def replace(sig, has_input):
+        if not _candidate(sig, has_input):
+            return sig
+
+        value = next(cached)
+        if value is None:
+            return sig
+
+        from cu.cache.tasks import constant
+        return constant.si(value = value)
+
+    return _walk(canvas, False, replace)
@@ -0,0 +1,71 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import celery
+
+from cu.app \
+    import CELERY_APP
+
+from .prune \
+    import prune_cached
+
+
+def _check_many(calls):
+    return [(kwargs.get('x', 0) < 10, 'cached_{}'.format(kwargs.get('x')))
+            for _, kwargs in calls]
+
+
+@CELERY_APP.task(name = 'cu.cache.prune_test.cached')
+def _cached(x):
+    return x
+_cached.check_many = _check_many
+
+
+@CELERY_APP.task(name = 'cu.cache.prune_test.other')
+def _other(*args, **kwargs):
+    return args
+
+
+def _tasks(canvas):
+    return [x.task.split('.')[-1] for x in canvas.tasks]
+
+
+def test_chain():
+    canvas = prune_cached(_cached.si(x = 1) | _cached.s() | _other.s())
+    assert ['constant', 'cached', 'other'] == _tasks(canvas)
+    assert 'cached_1' == canvas.tasks[0].kwargs['value']
+
+    canvas = prune_cached(_cached.si(x = 1) | _cached.si(x = 2))
+    assert 'cached_2' == canvas.kwargs['value']
+
+    canvas = _cached.si(x = 11) | _other.s()
+    assert canvas is prune_cached(canvas)
+
+
+def test_chord():
+    canvas = prune_cached\
+        (celery.chord([_cached.si(x = i) for i in range(3)],
+                      _other.s()))
+    assert ['constant', 'other'] == _tasks(canvas)
+    assert ['cached_0', 'cached_1', 'cached_2'] == \
+        canvas.tasks[0].kwargs['value']
+
+    canvas = prune_cached\
+        (celery.chord([_cached.si(x = i) for i in (1, 20)],
+                      _other.s()))
+    assert isinstance(canvas, celery.chord)
+    assert ['constant', 'cached'] == _tasks(canvas)
@@ -80,3 +80,36 @@ def call_fn_cache(result, ofn, call_serialiser, cache_kwargs):
     move_file(result_rmt.path, ofn.path, True)
     ofn.upload()
     return str(ofn)
+
+
+@task(cache = False, get_args_locally = False,
+      route_by_cache = False)
+def join_batches(results):
+    """Join results of batches, see ?cu.cache.batch.batches
+    """
+    return [x for res in results for x in res]
+
+
+@task(cache = False, get_args_locally = False,
+      route_by_cache = False)
+def fill_results(computed, results, todo):
+    """Fill computed results in, see ?cu.cache.batch.cached_map
+
+    :computed: list of lists of results of batches
+
+    :results: list of results, None for results being computed
+
+    :todo: list of lists of indices of computed results
+    """
+    for idx, values in zip(todo, computed):
+        for i, x in zip(idx, values):
+            results[i] = x
+    return results
+
+
+@task(cache = False, get_args_locally = False,
+      route_by_cache = False)
+def constant(value):
+    """Return value, see ?cu.cache.prune.prune_cached
+    """
+    return value
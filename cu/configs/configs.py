@@ -68,7 +68,9 @@ _CONFIGS['__help__broker'] = dict(
 _CONFIGS['worker'] = dict(
     workers = 2,
     queues = 'celery',
-    max_memory = 2097152)
+    max_memory = 2097152,
+    download_threads = 8,
+    prefetch_budget = 1024)
 _CONFIGS['__help__worker'] = dict(
     workers = """maximum number of workers on node
 
@@ -85,7 +87,46 @@ _CONFIGS['__help__worker'] = dict(
 
     If the worker consumes more than this limit, it is being replaced
     after child process is done. This helps to prevent memory leaks
-    caused by children""")
+    caused by children""",
+    download_threads = """maximum number of remote task arguments downloaded at once
+
+    Remote paths are collected from arbitrarily nested arguments, and
+    downloaded in parallel by this many threads""",
+    prefetch_budget = """maximum size (in MiB) of inputs being prefetched
+
+    Remote arguments of tasks reserved by a worker are downloaded
+    to the local cache, while the worker is busy with other
+    tasks. Downloads beyond this budget are left to the task itself.
+    Set 0 to disable prefetching""")
+
+_CONFIGS['routing'] = dict(
+    enabled = False,
+    node = '',
+    summary_interval = 60,
+    error_rate = 0.01,
+    min_size = 16)
+_CONFIGS['__help__routing'] = dict(
+    enabled = """if route tasks to nodes that have their inputs cached
+
+    Every worker publishes a summary (a Bloom filter) of its local
+    cache to redis, and consumes, in addition to 'queues', a
+    node-specific queue '<queue>@<node>' for each of them. A task is
+    sent to the node-specific queue of the node that has cached most
+    bytes of the task remote arguments.
+
+    Use @task(route_by_cache = False) to opt out a task""",
+    node = """name of the node
+
+    Empty value stands for the hostname""",
+    summary_interval = """seconds between updates of the cache summaries
+
+    A summary expires after 2 intervals without an update, and the
+    node is not routed to then""",
+    error_rate = """false positive rate of the cache summaries""",
+    min_size = """minimum size (in MiB) of cached inputs to route a task
+
+    Tasks with less cached inputs are sent to 'queue' and are picked
+    up by any worker""")
 
 _CONFIGS['localcache'] = dict(
     path = 'data/results_cache',
@@ -132,7 +173,12 @@ _CONFIGS['webserver'] = dict(
     workers = 2,
     max_requests = 100,
     timeout = 20,
-    uploads_dir = 'uploads')
+    uploads_dir = 'uploads',
+    worker_class = 'sync',
+    threads = 1,
+    worker_connections = 1000,
+    preload_methods = [],
+    events_timeout = 3600)
 _CONFIGS['__help__webserver'] = dict(
     host = """ip address for a webserver to listen requests to""",
     port = """port for a webserver to listen requests to""",
@@ -142,7 +188,84 @@ _CONFIGS['__help__webserver'] = dict(
     uploads_dir = """directory where uploads are stored
 
     The directory is resolved relative to
-    CONFIGS['localcache']['path']""")
+    CONFIGS['localcache']['path']""",
+    worker_class = """gunicorn worker class
+
+    With 'sync' a worker serves one request at a time, and a request
+    waiting for a task result blocks the worker for up to 'timeout'
+    seconds. With 'gthread' (see 'threads') or 'gevent' (requires
+    gevent, see 'worker_connections') a worker holds many pending
+    requests, each waiting for a redis notification of the task
+    result""",
+    threads = """number of threads per worker for 'gthread' worker_class""",
+    worker_connections = """maximum number of simultaneous connections per worker
+
+    Used by the 'gevent' worker_class""",
+    preload_methods = """list of methods resolved at the webserver start
+
+    For example, ["cu/webserver/upload/upload"]. Methods are otherwise
+    imported and their docs parsed on the first request to every
+    webserver worker""",
+    events_timeout = """maximum duration (in seconds) of an /api/events stream
+
+    Note, every open stream keeps a webserver worker busy, unless an
+    asynchronous worker_class is used. gunicorn kills a 'sync' worker
+    after 'timeout', hence with the 'sync' worker_class streams are
+    limited to half of 'timeout'. Clients reconnect after the
+    'timeout' event""")
+
+_CONFIGS['metrics'] = dict(
+    enabled = False,
+    profile_layers = False)
+_CONFIGS['__help__metrics'] = dict(
+    enabled = """if record metrics of tasks and webserver requests
+
+    Wall and cpu time, bytes downloaded and uploaded, cache hits and
+    time waiting for locks are aggregated per task in redis, see
+    ?cu.utils.metrics.task_metrics. Latency of webserver requests is
+    recorded in the 'cu_request_seconds' histogram, see
+    ?cu.webserver.metrics.request_metrics""",
+    profile_layers = """if time every layer of tasks separately
+
+    Decorators of @task, compute_ofn, storage calls and locks are
+    timed on every call and added to the metrics of the task (requires
+    'enabled'), see ?cu.utils.profile_layers.layer. This adds some
+    overhead, use for profiling only""")
+
+_CONFIGS['tracing'] = dict(
+    enabled = False,
+    expire = 86400)
+_CONFIGS['__help__tracing'] = dict(
+    enabled = """if trace method calls of the webserver
+
+    The trace of a call gets the id of its generate_task_queue job,
+    and is continued by every task sent within the call. Spans (queue
+    wait, input fetch, compute, upload, cache check, lock wait) are
+    stored in redis, or in <local_root>/traces in the local mode.
+    See ?cu.utils.tracing.summary for the critical path of a call,
+    and the webserver '/api/trace/<job id>'""",
+    expire = """seconds to keep spans of a trace""")
+
+_CONFIGS['profiler'] = dict(
+    regex = '',
+    probability = 0.0,
+    interval = 0.005,
+    min_seconds = 0.0,
+    keep = 20,
+    refresh = 30.0)
+_CONFIGS['__help__profiler'] = dict(
+    regex = """profile all calls of tasks with names matching the regex
+
+    Settings of the profiler can be changed on running workers, see
+    ?cu.utils.sampling_profiler.configure""",
+    probability = """probability to profile a call of any task""",
+    interval = """seconds between samples of the stack""",
+    min_seconds = """store profiles of calls that take at least that long
+
+    Profiles are stored in the remote storage, and listed in
+    ?cu.utils.sampling_profiler.get_profiles""",
+    keep = """number of recent profiles to list per task""",
+    refresh = """seconds between reading settings on workers""")
 
 _CONFIGS['logging'] = dict(
     path = 'data/logs',
@@ -272,6 +395,12 @@ def _check_datatype(example, value):
     if not isinstance(value, str):
         return value
 
+    # bool is a subclass of int
+    if isinstance(example, bool):
+        if value.lower() not in ConfigParser.BOOLEAN_STATES:
+            raise ValueError("not a boolean: {}".format(value))
+        return ConfigParser.BOOLEAN_STATES[value.lower()]
+
     for t in (int, float):
         if isinstance(example, t):
             return t(value)
@@ -0,0 +1,68 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import copy
+
+from . import configs
+
+
+def _read(monkeypatch, tmpdir, text):
+    monkeypatch.setattr(configs, '_CONFIGS',
+                        copy.deepcopy(configs._CONFIGS))
+    fn = str(tmpdir.join('cu.conf'))
+    with open(fn, 'w') as f:
+        f.write(text)
+    return configs.read_configs(fn)
+
+
+def test_bool(monkeypatch, tmpdir):
+    res = _read(monkeypatch, tmpdir, """
+[routing]
+enabled = True
+[metrics]
+enabled = no
+profile_layers = 1
+""")
+    assert res['routing']['enabled'] is True
+    assert res['metrics']['enabled'] is False
+    assert res['metrics']['profile_layers'] is True
+
+
+def test_generated(monkeypatch, tmpdir):
+    defaults = copy.deepcopy(configs._CONFIGS)
+    fn = str(tmpdir.join('default.conf'))
+    configs.generate_configs(fn)
+    with open(fn) as f:
+        res = _read(monkeypatch, tmpdir, f.read())
+
+    for section in ('routing', 'metrics', 'tracing', 'profiler'):
+        assert defaults[section] == res[section]
+
+
+def test_float(monkeypatch, tmpdir):
+    res = _read(monkeypatch, tmpdir, """
+[profiler]
+probability = 0.05
+min_seconds = 2.5
+interval = 0.01
+refresh = 10
+""")
+    assert 0.05 == res['profiler']['probability']
+    assert 2.5 == res['profiler']['min_seconds']
+    assert 0.01 == res['profiler']['interval']
+    assert 10.0 == res['profiler']['refresh']
@@ -21,9 +21,15 @@ import celery
 from functools import wraps
 
 from cu.app \
-    import CELERY_APP
+    import CELERY_APP, CONFIGS
+from cu.cache.batch \
+    import batch_runner, batches, cached_map
+from cu.cache.prune \
+    import prune_cached
 from cu.storage.get_locally \
     import get_locally
+from cu.storage.routing \
+    import RouteByCache
 from cu.utils.addattr \
     import AddAttr
 from cu.utils.addretry \
@@ -36,11 +42,19 @@ from cu.utils.debug_function_info \
     import debug_decorator
 from cu.utils.matchargs \
     import matchargs
+from cu.utils.metrics \
+    import task_metrics
+from cu.utils.profile_layers \
+    import profile_layer
+from cu.utils.sampling_profiler \
+    import sampled
+from cu.utils.tracing \
+    import traced
 
 
 def task(cache = True, queue = 'celery',
          get_args_locally = True, debug_info = False,
-         **kwargs):
+         route_by_cache = True, batch = 0, **kwargs):
     """Make a function to be a celery task
 
     :cache: if True, results are cached
@@ -52,7 +66,21 @@ def task(cache = True, queue = 'celery',
 
     :debug_info: if True log extra debug info
 
-    :return_type, remove_return, ignore, storage_type: see
+    :route_by_cache: if the task may be sent to a node that caches its
+    remote arguments, see CONFIGS['routing']
+
+    :batch: if positive, the task gets a method .batches(calls),
+    which returns a canvas that runs calls in batches of this size,
+    see ?cu.cache.batch.batches. Each batch is a single worker
+    execution, see ?cu.cache.batch.batch_runner. Calls are
+    dictionaries of keyword arguments. .cached_map(calls) does the
+    same, but only calls that are not cached are sent to workers, see
+    ?cu.cache.batch.cached_map
+
+    Calls of a task can be run under a sampling profiler, see
+    CONFIGS['profiler'] and ?cu.utils.sampling_profiler.sampled
+
+    :return_type, remove_return, ignore, direct_write, storage_type: see
     ?cu.cache.cache.cache_fn
 
     :keys, storage_type, ofn_arg, path_prefix, path_prefix_arg,
@@ -68,40 +96,75 @@ def task(cache = True, queue = 'celery',
 
     """
     def wrapper(fun):
+        fun = profile_layer('function')(traced('compute')(fun))
+
         if debug_info:
-            fun = matchargs(debug_decorator)(**kwargs)(fun)
+            fun = profile_layer('debug_decorator')\
+                (matchargs(debug_decorator)(**kwargs)(fun))
 
         if get_args_locally:
-            fun = get_locally(fun)
+            fun = profile_layer('get_locally')(get_locally(fun))
+        if batch > 0:
+            run_batch = batch_runner\
+                (fun, cache = cache,
+                 get_args_locally = get_args_locally, **kwargs)
 
-        fun = matchargs(one_instance)(**kwargs)(fun)
+        fun = profile_layer('one_instance')\
+            (matchargs(one_instance)(**kwargs)(fun))
 
         if cache:
             from cu.cache.cache import cache_fn
-            fun = matchargs(cache_fn)(**kwargs)(fun)
+            fun = profile_layer('cache_fn')\
+                (matchargs(cache_fn)(**kwargs)(fun))
+
+        name = '{}.{}'.format(fun.__module__, fun.__name__)
+        fun = sampled(name)(fun)
+        if CONFIGS['metrics']['enabled']:
+            fun = task_metrics(name)(fun)
+            if batch > 0:
+                run_batch = task_metrics(name + '_batch')(run_batch)
 
         attr = {'cache': cache,
                 'get_args_locally': get_args_locally,
-                'debug_info': debug_info}
+                'debug_info': debug_info,
+                'route_by_cache': route_by_cache,
+                'batch': batch}
         attr.update(**kwargs)
         if hasattr(fun, '_cache_args'):
             attr.update(fun._cache_args)
 
         bs_cls = AddAttr(**attr)(celery.Task)
         bs_cls = matchargs(AddRetry)(**kwargs)(bs_cls)
+        if route_by_cache:
+            bs_cls = RouteByCache()(bs_cls)
 
         @CELERY_APP.task(bind = True, queue = queue, base = bs_cls)
         @wraps(fun)
         def wrap(self, *a, **kw):
             return fun(*a, **kw)
 
+        if batch > 0:
+            @CELERY_APP.task(bind = True, queue = queue, base = bs_cls,
+                             name = wrap.name + '_batch')
+            def batch_wrap(self, calls):
+                return run_batch(calls)
+
+            wrap.batch_task = batch_wrap
+            wrap.batches = lambda calls: \
+                batches(batch_wrap, calls, batch)
+            wrap.cached_map = lambda calls: \
+                cached_map(wrap, calls, batch)
+
+        if hasattr(fun, 'check_many'):
+            wrap.check_many = fun.check_many
+
         return wrap
     return wrapper
 
 
 def call(cache = True, get_args_locally = False,
          debug_info = True, add_calldocs = True,
-         autoretry_for = [], **kwargs):
+         autoretry_for = [], prune = False, **kwargs):
     """A decorator that produces chain of celery tasks
 
     :cache: if True, results are cached
@@ -118,6 +181,11 @@ def call(cache = True, get_args_locally = False,
     :autoretry_for: this specifies exceptions occurring during the
     call execution, that should trigger the autoretry
 
+    :prune: if replace tasks with results in the storage by their
+    results, before the canvas is dispatched, see
+    ?cu.cache.prune.prune_cached. Note, the cached canvas is not
+    pruned
+
     :call_serialiser, storage_type: see ?cu.cache.cache.cache_call
 
     :keys, storage_type, ofn_arg, path_prefix, path_prefix_arg,
@@ -144,12 +212,15 @@ def call(cache = True, get_args_locally = False,
 
         @wraps(fun)
         def wrap(*a, **kw):
+            if prune:
+                return prune_cached(fun(*a, **kw))
             return fun(*a, **kw)
 
         attr = {'cache': cache,
                 'get_args_locally': get_args_locally,
                 'debug_info': debug_info,
-                'autoretry_for': autoretry_for}
+                'autoretry_for': autoretry_for,
+                'prune': prune}
         attr.update(**kwargs)
         if hasattr(fun, '_cache_args'):
             attr.update(fun._cache_args)
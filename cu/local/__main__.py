@@ -0,0 +1,39 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# usage: CU_LOCAL_MODE=1 python -m cu.local [--profile]
+#
+# --profile times every layer of a no-op task, see
+# ?cu.local.benchmark.profile
+
+import sys
+
+from cu.app \
+    import CONFIGS
+from cu.utils \
+    import profile_layers
+
+if '--profile' in sys.argv:
+    # before tasks of the benchmark are decorated
+    CONFIGS['metrics']['enabled'] = True
+    profile_layers.enable()
+
+from cu.local.benchmark \
+    import main
+
+
+main(if_profile = '--profile' in sys.argv)
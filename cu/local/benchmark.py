@@ -0,0 +1,162 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+import celery
+import statistics
+
+from cu.app \
+    import CONFIGS
+
+from cu.decorators \
+    import task, call
+
+from cu.utils.metrics \
+    import get_metrics
+from cu.utils.profile_layers \
+    import enabled, breakdown
+
+
+@task(return_type = 'msgpack')
+def bench_square(x):
+    return x*x
+
+
+@task(return_type = 'msgpack')
+def bench_sum(xs):
+    return sum(xs)
+
+
+@task(return_type = 'msgpack')
+def bench_noop(x = 0):
+    return None
+
+
+@call()
+def bench_call(n = 10, seed = 0):
+    """Sum of n squares
+
+    :n: number of bench_square tasks
+
+    :seed: changes arguments of all tasks
+    """
+    return celery.chord\
+        ([bench_square.signature(kwargs = {'x': seed*n + i})
+          for i in range(n)], bench_sum.signature())
+
+
+def _timeit(stages, name, fun, *args, **kwargs):
+    start = time.perf_counter()
+    res = fun(*args, **kwargs)
+    stages.setdefault(name, []).append(time.perf_counter() - start)
+    return res
+
+
+def _report(stages):
+    res = ["{:<24} {:>10} {:>10} {:>10}"\
+           .format('stage', 'median ms', 'min ms', 'max ms')]
+    for name, times in stages.items():
+        res += ["{:<24} {:>10.3f} {:>10.3f} {:>10.3f}"\
+                .format(name, 1000*statistics.median(times),
+                        1000*min(times), 1000*max(times))]
+    return '\n'.join(res)
+
+
+def run(repeat = 10, n = 10):
+    """Time cold and warm calls through the whole stack
+
+    Requires the local mode, i.e. the CU_LOCAL_MODE environment
+    variable set before cu is imported.
+
+    :repeat: number of repetitions of every stage
+
+    :n: number of tasks in the benchmark call
+
+    :return: dictionary: stage -> list of seconds
+
+    """
+    if CONFIGS['local_root'] is None:
+        raise RuntimeError("CU_LOCAL_MODE is not set!")
+
+    from cu.webserver.utils import call_method
+
+    method = 'cu/local/benchmark/bench_call'
+    # distinct from the arguments used by bench_call
+    offset = 10*repeat*n
+
+    stages = {}
+    for i in range(repeat):
+        _timeit(stages, 'task cold', bench_square.delay, x = offset + i)
+        _timeit(stages, 'task warm', bench_square.delay, x = offset + i)
+        _timeit(stages, 'call_method cold', call_method,
+                method, {'n': n, 'seed': i})
+        _timeit(stages, 'call_method warm', call_method,
+                method, {'n': n, 'seed': i})
+
+    return stages
+
+
+def _delta(after, before):
+    return {k: v - before.get(k, 0) for k, v in after.items()}
+
+
+def profile(repeat = 100):
+    """Time layers of a no-op task on a warm cache hit
+
+    Requires the local mode and profiled layers, see
+    ?cu.utils.profile_layers.enable.
+
+    :repeat: number of calls
+
+    :return: list of (layer, seconds per call). The 'rest' layer is
+    the time of a call not spent in any layer, e.g. in celery or in
+    recording the metrics
+    """
+    if CONFIGS['local_root'] is None:
+        raise RuntimeError("CU_LOCAL_MODE is not set!")
+    if not enabled():
+        raise RuntimeError("layers are not profiled!")
+
+    name = '{}.{}'.format(__name__, 'bench_noop')
+    bench_noop.delay().get()
+
+    before = get_metrics().get(name, {})
+    start = time.perf_counter()
+    for _ in range(repeat):
+        bench_noop.delay().get()
+    total = (time.perf_counter() - start) / repeat
+    values = _delta(get_metrics()[name], before)
+
+    res = [(layer, seconds / repeat)
+           for layer, calls, seconds in breakdown(values) if calls]
+    return res + [('rest', total - sum(x for _, x in res))]
+
+
+def _report_profile(layers):
+    res = ["{:<32} {:>12}".format('layer', 'us per call')]
+    for name, seconds in layers:
+        res += ["{:<32} {:>12.1f}".format(name, 1e6*seconds)]
+    return '\n'.join(res)
+
+
+def main(if_profile = False):
+    stages = run()
+    print(_report(stages))
+    if if_profile:
+        print()
+        print(_report_profile(profile()))
+    print("data: {}".format(CONFIGS['local_root']))
@@ -0,0 +1,68 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import tempfile
+
+
+# celery runs tasks in the calling process, results are kept in memory
+LOCAL_CELERY_CONF = dict(
+    broker_url = 'memory://',
+    result_backend = 'cache+memory://',
+    task_always_eager = True,
+    task_store_eager_result = True)
+
+
+def local_root(value):
+    """Directory of the local mode
+
+    :value: value of the CU_LOCAL_MODE environment variable. '1'
+    creates a new temporary directory, otherwise it is a path
+
+    """
+    if '1' == value:
+        return tempfile.mkdtemp(prefix = 'cu_local_')
+
+    os.makedirs(value, exist_ok = True)
+    return os.path.realpath(value)
+
+
+def local_configs(configs, root):
+    """Adjust configs to run everything in a single process
+
+    redis is replaced with an in-process fakeredis (see
+    ?cu.utils.redis.client.get_client), the local cache, logs and the
+    remote storage are placed in root.
+
+    :configs: see ?cu.configs.configs.read_configs
+
+    :root: directory for all data, see ?local_root
+
+    """
+    storage = os.path.join(root, 'storage')
+    os.makedirs(os.path.join(storage, 'data'), exist_ok = True)
+    open(os.path.join(storage, 'localio.sanity'), 'a').close()
+
+    configs['broker']['name'] = 'fakeredis'
+    configs['localcache']['path'] = os.path.join(root, 'results_cache')
+    configs['logging']['path'] = os.path.join(root, 'logs')
+    configs['remotestorage']['use_remotes'] = ['localmount_']
+    configs['remotestorage']['default'] = 'localmount_local'
+    configs['localmount_'] = {'local': storage}
+    configs['local_root'] = root
+
+    return configs
@@ -0,0 +1,199 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import celery
+
+from concurrent.futures \
+    import ThreadPoolExecutor, ProcessPoolExecutor, \
+    wait, FIRST_COMPLETED
+
+from celery.canvas \
+    import Signature, _chain, group, chord
+
+
+_EXECUTORS = {
+    'thread': ThreadPoolExecutor,
+    'process': ProcessPoolExecutor
+}
+
+
+class _Node:
+
+
+    def __init__(self, sig = None, deps = None):
+        """Node of a task graph
+
+        :sig: signature of a task. If None, the node gathers the
+        values of deps into a list
+
+        :deps: list of nodes the node depends on
+
+        """
+        self.sig = sig
+        self.deps = list(deps or [])
+        self.children = []
+        self.waiting = len(self.deps)
+        self.value = None
+
+        for x in self.deps:
+            x.children.append(self)
+
+
+def _signature(sig):
+    if isinstance(sig, Signature):
+        return sig
+
+    return celery.signature(sig)
+
+
+def _key(sig, parent):
+    return (sig.task, repr(sig.args),
+            repr(sorted(sig.kwargs.items())),
+            sig.immutable, id(parent))
+
+
+def _build(sig, parent, nodes, tasks = None):
+    """Build task graph of a canvas
+
+    Identical tasks with the same parent share a node, i.e. they run
+    once. Otherwise both copies would run at the same time, and one
+    of them fails with TASK_RUNNING, see
+    ?cu.utils.one_instance.one_instance
+
+    :sig: a canvas
+
+    :parent: node whose value is passed to the first task of sig, or
+    None
+
+    :nodes: list, all created nodes are appended to it
+
+    :tasks: dictionary of created task nodes, see ?_key
+
+    :return: node with the value of the canvas
+
+    """
+    sig = _signature(sig)
+    if tasks is None:
+        tasks = {}
+
+    if isinstance(sig, chord):
+        header = sig.tasks
+        if not isinstance(header, group):
+            header = group(header)
+        return _build(sig.body, _build(header, parent, nodes, tasks),
+                      nodes, tasks)
+
+    if isinstance(sig, group):
+        node = _Node(deps = [_build(x, parent, nodes, tasks)
+                             for x in sig.tasks])
+    elif isinstance(sig, _chain):
+        for x in sig.tasks:
+            parent = _build(x, parent, nodes, tasks)
+        return parent
+    else:
+        key = _key(sig, parent)
+        if key in tasks:
+            return tasks[key]
+
+        node = _Node(sig = sig,
+                     deps = [] if parent is None else [parent])
+        tasks[key] = node
+
+    nodes.append(node)
+    return node
+
+
+def _apply(sig, args):
+    return sig.apply(args = args).get()
+
+
+def run_canvas(canvas, executor = 'thread', max_workers = None):
+    """Run a celery canvas without a broker
+
+    Chains, groups and chords are resolved into a graph of tasks, and
+    every task is run in a local pool as soon as the tasks it depends
+    on are done. Tasks run with all their decorators, hence results
+    are cached as usual.
+
+    :canvas: a celery canvas, e.g. returned by a @call
+
+    :executor: 'thread' or 'process'. With 'process', tasks must be
+    importable by their names, as they are for @task
+
+    :max_workers: size of the pool, see ?concurrent.futures.Executor
+
+    :return: result of the canvas
+
+    """
+    if executor not in _EXECUTORS:
+        raise RuntimeError\
+            ("executor = {} is not supported".format(executor))
+
+    nodes = []
+    last = _build(canvas, None, nodes)
+    futures = {}
+
+    with _EXECUTORS[executor](max_workers = max_workers) as pool:
+        def done(node, value):
+            node.value = value
+            for x in node.children:
+                x.waiting -= 1
+                if 0 == x.waiting:
+                    submit(x)
+
+        def submit(node):
+            if node.sig is None:
+                return done(node, [x.value for x in node.deps])
+
+            args = tuple(x.value for x in node.deps)
+            futures[pool.submit(_apply, node.sig, args)] = node
+
+        try:
+            for node in [x for x in nodes if not x.deps]:
+                submit(node)
+
+            while futures:
+                finished, _ = wait(futures, return_when = FIRST_COMPLETED)
+                for future in finished:
+                    done(futures.pop(future), future.result())
+        except BaseException:
+            pool.shutdown(wait = False, cancel_futures = True)
+            raise
+
+    return last.value
+
+
+def run_call(call, *args, executor = 'thread', max_workers = None,
+             **kwargs):
+    """Run a @call without a broker
+
+    :call: a function decorated with @call
+
+    :args, kwargs: arguments of the call
+
+    :executor, max_workers: see ?cu.local.executor.run_canvas
+
+    :return: result of the call
+
+    """
+    canvas = call(*args, **kwargs)
+
+    if not isinstance(canvas, Signature):
+        return canvas
+
+    return run_canvas(canvas, executor = executor,
+                      max_workers = max_workers)
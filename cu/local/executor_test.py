@@ -0,0 +1,134 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import sys
+import celery
+import pytest
+import subprocess
+
+from .executor \
+    import run_canvas
+
+
+_APP = celery.Celery(set_as_current = False)
+
+
+@_APP.task
+def _add(x, y = 0):
+    return x + y
+
+
+@_APP.task
+def _fail():
+    raise ValueError("fail")
+
+
+_CALLS = []
+
+
+@_APP.task
+def _count(x):
+    _CALLS.append(x)
+    return x
+
+
+def test_chain():
+    assert 6 == run_canvas(_add.s(1) | _add.s(2) | _add.s(3))
+
+
+def test_group():
+    assert [1, 2, 3] == run_canvas\
+        (celery.group(_add.s(i) for i in range(1, 4)))
+
+
+def test_chord():
+    canvas = celery.chord([_add.s(i) for i in range(10)], _add.s())
+    with pytest.raises(TypeError):
+        # list + int
+        run_canvas(canvas)
+
+    canvas = celery.chord([_add.s(i) for i in range(10)],
+                          _add.si(1, 2))
+    assert 3 == run_canvas(canvas)
+
+
+def test_nested(N = 20):
+    canvas = _add.s(1) \
+        | celery.group(_add.s(i) | _add.s(1) for i in range(N)) \
+        | _add.si(0)
+    assert 0 == run_canvas(canvas, max_workers = 2)
+
+    canvas = celery.group\
+        (celery.group(_add.s(i, i) for i in range(3)) for _ in range(N))
+    assert N*[[0, 2, 4]] == run_canvas(canvas, max_workers = 2)
+
+
+def test_duplicates():
+    del _CALLS[:]
+    canvas = celery.group(_count.si(1), _count.si(1), _count.si(2))
+    assert [1, 1, 2] == run_canvas(canvas)
+    assert [1, 2] == sorted(_CALLS)
+
+
+def test_failure():
+    with pytest.raises(ValueError):
+        run_canvas(_add.s(1) | celery.group(_fail.si(), _add.s(1)))
+
+
+# @task needs the local mode, which is set when cu is imported
+_LOCAL_TASKS = """
+import time
+import celery
+
+from cu import task
+from cu.local.executor import run_canvas
+from cu.storage.remotestorage_path import RemoteStoragePath
+
+
+@task(return_type = 'msgpack')
+def slow_square(x):
+    time.sleep(1)
+    return x*x
+
+
+@task(return_type = 'msgpack')
+def total(xs):
+    return sum(xs)
+
+
+res = run_canvas(celery.chord([slow_square.si(x = 2),
+                               slow_square.si(x = 2),
+                               slow_square.si(x = 3)], total.s()))
+print(RemoteStoragePath(res).get_locally(True))
+"""
+
+
+def test_local_tasks(tmpdir):
+    pytest.importorskip('fakeredis')
+
+    env = dict(os.environ, CU_LOCAL_MODE = str(tmpdir))
+    env['PYTHONPATH'] = os.pathsep.join\
+        ([os.path.dirname(os.path.dirname(os.path.dirname\
+                                          (os.path.abspath(__file__))))]
+         + [x for x in [env.get('PYTHONPATH')] if x])
+    res = subprocess.run([sys.executable, '-c', _LOCAL_TASKS],
+                         env = env, cwd = str(tmpdir),
+                         capture_output = True, text = True,
+                         timeout = 300)
+    assert 0 == res.returncode, res.stderr
+    assert '17' == res.stdout.strip().splitlines()[-1]
@@ -240,12 +240,24 @@ class Files_LRUCache:
         return len(self._deque)
 
 
+    def files(self):
+        """Return list of tracked files, least recently used first
+        """
+        return list(self._deque)
+
+
     def size(self):
         """Return total used space in bytes
         """
         return self._cache['total']
 
 
+    def evictions(self):
+        """Return number of files evicted from the cache
+        """
+        return self._cache.get('evictions', 0)
+
+
     def popleft(self):
         """Pop the least recently used file
 
@@ -259,6 +271,7 @@ class Files_LRUCache:
                 pass
 
             self._remove_fn(fn)
+            self._cache['evictions'] = self.evictions() + 1
             logging.debug("""
             file is removed from cache: {}
             Files_LRUCache size: {:.5f} GB
@@ -15,36 +15,114 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
+import time
+import logging
+import contextvars
 
 from functools import wraps
 
+from concurrent.futures \
+    import ThreadPoolExecutor
+
+from cu.app \
+    import CONFIGS
+
 from cu.storage.remotestorage_path \
     import RemoteStoragePath, is_remote_path
 
+from cu.utils.tracing \
+    import span
+
+
+def _collect(x, paths):
+    if isinstance(x, dict):
+        for v in x.values():
+            _collect(v, paths)
+
+    if isinstance(x, (list, tuple)):
+        for v in x:
+            _collect(v, paths)
 
-def _get_locally_item(x):
+    if is_remote_path(x):
+        paths.add(x)
+
+    return paths
+
+
+def _replace(x, local):
     if isinstance(x, dict):
-        x = {k:_get_locally_item(v) for k,v in x.items()}
+        return {k:_replace(v, local) for k,v in x.items()}
 
-    if isinstance(x, (list, tuple)) and \
-       len(x) and isinstance(x[0], str):
-        x = [_get_locally_item(v) for v in x]
+    if isinstance(x, (list, tuple)):
+        res = [_replace(v, local) for v in x]
+        if hasattr(x, '_fields'):
+            # namedtuple
+            return type(x)(*res)
+        return type(x)(res)
 
-    if isinstance(x, str) and is_remote_path(x):
-        x = RemoteStoragePath(x).get_locally(True)
+    if isinstance(x, str) and x in local:
+        return local[x]
 
     return x
 
 
+def _fetch(path):
+    return RemoteStoragePath(path).get_locally(True)
+
+
+def fetch_paths(paths, max_workers = None):
+    """Get locally remote paths in parallel
+
+    :paths: iterable of remote paths
+
+    :max_workers: number of threads. By default
+    CONFIGS['worker']['download_threads']
+
+    :return: a dictionary remote path -> local data (see
+    ?cu.storage.remotestorage_path.RemoteStoragePath.get_locally), and
+    the time spent fetching in seconds
+
+    """
+    paths = sorted(set(paths))
+    if max_workers is None:
+        max_workers = int(CONFIGS['worker']['download_threads'])
+
+    start = time.time()
+    if len(paths) < 2 or max_workers < 2:
+        local = {x:_fetch(x) for x in paths}
+    else:
+        with ThreadPoolExecutor\
+             (max_workers = min(max_workers, len(paths))) as pool:
+            # metrics of downloads are added to the calling task
+            contexts = [contextvars.copy_context() for _ in paths]
+            local = dict(zip(paths, pool.map\
+                             (lambda c, x: c.run(_fetch, x),
+                              contexts, paths)))
+
+    return local, time.time() - start
+
+
 def _get_locally(*args, **kwargs):
     """Make sure all remote files are available locally
 
-    Note, only the first level of argument is walked. For example, if
-    argument is a list of files, this list is not checked.
+    Arguments are walked recursively through dictionaries, lists and
+    tuples. Every distinct remote path is downloaded once, and
+    downloads run in parallel, see ?fetch_paths.
+
     """
-    args = [_get_locally_item(x) for x in args]
+    paths = _collect(args, set())
+    paths = _collect(kwargs, paths)
+    if not paths:
+        return list(args), kwargs
+
+    with span('input_fetch', paths = len(paths)):
+        local, elapsed = fetch_paths(paths)
+    logging.info("fetched {} remote arguments in {:.3f} seconds"\
+                  .format(len(local), elapsed))
+
+    args = [_replace(x, local) for x in args]
 
-    kwargs = {k:_get_locally_item(v) \
+    kwargs = {k:_replace(v, local) \
               for k,v in kwargs.items()}
 
     return args, kwargs
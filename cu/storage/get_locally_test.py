@@ -0,0 +1,65 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+import threading
+
+from collections import namedtuple
+
+from . import get_locally as gl
+
+
+def _paths(n):
+    return ['localmount_dir://tile_{}'.format(i) for i in range(n)]
+
+
+def test_nested(monkeypatch):
+    fetched = []
+    def fetch(path):
+        fetched.append(path)
+        return path.upper()
+    monkeypatch.setattr(gl, '_fetch', fetch)
+
+    p = _paths(3)
+    pair = namedtuple('pair', ['a', 'b'])
+    args, kwargs = gl._get_locally\
+        (1, [p[0], {'x': (p[1], 'local')}], pair(p[0], 2),
+         tiles = [[p[2]], [p[1]]])
+
+    assert [1, [p[0].upper(), {'x': (p[1].upper(), 'local')}],
+            pair(p[0].upper(), 2)] == args
+    assert {'tiles': [[p[2].upper()], [p[1].upper()]]} == kwargs
+    assert sorted(p) == sorted(fetched)
+
+
+def test_parallel(monkeypatch, N = 8):
+    running = [0, 0]
+    lock = threading.Lock()
+    def fetch(path):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return path
+    monkeypatch.setattr(gl, '_fetch', fetch)
+
+    local, elapsed = gl.fetch_paths(_paths(N) * 2, max_workers = 4)
+    assert N == len(local)
+    assert 4 == running[1]
+    assert elapsed < 0.05 * N
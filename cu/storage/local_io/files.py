@@ -20,6 +20,8 @@ import os
 import time
 import shutil
 import logging
+import tempfile
+import contextlib
 
 from cu.utils.redis.lock \
     import RedisLock
@@ -97,6 +99,12 @@ class LOCALIO_Files:
         return os.path.join(self._root, "data", fn.lstrip(os.path.sep))
 
 
+    def _tmp_dir(self):
+        res = os.path.join(self._root, "tmp")
+        os.makedirs(res, exist_ok = True)
+        return res
+
+
     def _check_fn(self, storage_fn):
         res = os.path.join(self._root, "failchecks", storage_fn.lstrip(os.path.sep))
         _mkdir(res)
@@ -151,6 +159,54 @@ class LOCALIO_Files:
         return os.stat(self._storage_fn(storage_fn)).st_mtime
 
 
+    def get_size(self, storage_fn):
+        if storage_fn not in self:
+            return None
+
+        return os.stat(self._storage_fn(storage_fn)).st_size
+
+
+    def get_timestamps(self, storage_fns):
+        """get timestamps of many files at once
+
+        Unlike ?get_timestamp no locks are taken. A file that is being
+        uploaded is reported as missing.
+
+        :storage_fns: list of paths relative to the storage root
+
+        :return: list of timestamps, None for missing files
+
+        """
+        self._sanity()
+
+        res = []
+        for storage_fn in storage_fns:
+            try:
+                # a check file is created before the upload starts
+                mtime = os.stat(self._storage_fn(storage_fn)).st_mtime
+                if os.path.exists(self._check_fn(storage_fn)):
+                    mtime = None
+            except FileNotFoundError:
+                mtime = None
+            res += [mtime]
+
+        return res
+
+
+    def update_timestamps(self, storage_fns):
+        """update timestamps of many existing files at once
+
+        :storage_fns: list of paths relative to the storage root
+
+        """
+        now = time.time()
+        for storage_fn in storage_fns:
+            try:
+                os.utime(self._storage_fn(storage_fn), (now, now))
+            except FileNotFoundError:
+                pass
+
+
     def update_timestamp(self, storage_fn):
         if storage_fn not in self:
             return None
@@ -197,6 +253,42 @@ class LOCALIO_Files:
             _unlink(chck)
 
 
+    @contextlib.contextmanager
+    def upload_to(self, storage_fn, timestamp = None):
+        """write a file directly into the storage
+
+        Yields a temporary path in the 'tmp' directory of the storage
+        root, which is on the same filesystem, but outside the data
+        tree. If the context exits without an exception, the temporary
+        file is atomically renamed to the storage file. Hence, the file
+        is written once and a partially written file is never visible.
+
+        :storage_fn: path relative to the storage root
+
+        :timestamp: optionally set specific timestamp. If None,
+        timestamp is not set (actual time is used)
+
+        """
+        self._sanity()
+
+        sfn = self._storage_fn(storage_fn)
+        fd, tmp = tempfile.mkstemp\
+            (dir = self._tmp_dir(),
+             prefix = os.path.basename(sfn) + '.',
+             suffix = '.tmp')
+        os.close(fd)
+
+        try:
+            yield tmp
+
+            _mkdir(sfn)
+            with self._lock(storage_fn):
+                os.replace(tmp, sfn)
+                self._set_timestamp(storage_fn, timestamp)
+        finally:
+            _unlink(tmp)
+
+
     def link(self, src, dst, timestamp = None):
         """hardlink files within storage
 
@@ -0,0 +1,65 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import pytest
+import contextlib
+
+from .files \
+    import LOCALIO_Files, _touch, _mkdir
+
+
+def test_get_timestamps(tmp_path):
+    storage = LOCALIO_Files(root = str(tmp_path), redis_url = None)
+    _touch(os.path.join(str(tmp_path), 'localio.sanity'))
+
+    for fn in ('a', 'b/c', 'uploading'):
+        sfn = storage._storage_fn(fn)
+        _mkdir(sfn)
+        _touch(sfn, (100, 100))
+    _touch(storage._check_fn('uploading'))
+
+    assert [100, 100, None, None] == storage.get_timestamps\
+        (['a', 'b/c', 'uploading', 'missing'])
+
+    storage.update_timestamps(['a', 'missing'])
+    assert 100 < storage.get_timestamps(['a'])[0]
+    assert 100 == storage.get_timestamps(['b/c'])[0]
+
+
+def test_upload_to(tmp_path, monkeypatch):
+    storage = LOCALIO_Files(root = str(tmp_path), redis_url = None)
+    _touch(os.path.join(str(tmp_path), 'localio.sanity'))
+    monkeypatch.setattr(storage, '_lock',
+                        lambda fn: contextlib.nullcontext())
+    data = os.path.join(str(tmp_path), 'data')
+
+    with storage.upload_to('a/b', timestamp = 100) as tmp:
+        assert not os.path.exists(data)
+        with open(tmp, 'w') as f:
+            f.write('b')
+
+    assert ['b'] == os.listdir(os.path.join(data, 'a'))
+    assert 100 == storage.get_timestamps(['a/b'])[0]
+    with open(storage._storage_fn('a/b')) as f:
+        assert 'b' == f.read()
+
+    with pytest.raises(ValueError):
+        with storage.upload_to('a/c') as tmp:
+            raise ValueError()
+    assert ['b'] == os.listdir(os.path.join(data, 'a'))
+    assert [] == os.listdir(storage._tmp_dir())
@@ -0,0 +1,164 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import logging
+import threading
+
+from concurrent.futures \
+    import ThreadPoolExecutor
+
+from celery.signals \
+    import task_received
+
+from cu.app \
+    import CONFIGS
+
+from cu.storage.get_locally \
+    import _collect
+
+from cu.storage.remotestorage_path \
+    import RemoteStoragePath
+
+
+def _size(path):
+    """Size of a remote path to download, or None if nothing to do
+    """
+    rpath = RemoteStoragePath(path)
+    if rpath.is_local() or not rpath.in_storage():
+        return None
+
+    return rpath.get_size()
+
+
+def _fetch(path):
+    RemoteStoragePath(path).get_locally()
+
+
+class Prefetcher:
+
+
+    def __init__(self, budget, max_workers):
+        """Download remote paths in background threads
+
+        :budget: maximum number of bytes downloaded at once. A path
+        that does not fit in the budget is skipped
+
+        :max_workers: number of download threads
+
+        """
+        self._budget = budget
+        self._inflight = 0
+        self._paths = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor\
+            (max_workers = max_workers,
+             thread_name_prefix = 'cu_prefetch')
+
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+
+    def submit(self, paths):
+        """Queue paths for a download
+
+        Paths that are queued or downloaded already are ignored.
+
+        :paths: iterable of remote paths
+
+        :return: list of futures, one per queued path
+        """
+        res = []
+        for path in paths:
+            with self._lock:
+                if path in self._paths:
+                    continue
+                self._paths.add(path)
+            res += [self._pool.submit(self._prefetch, path)]
+        return res
+
+
+    def _reserve(self, size):
+        with self._lock:
+            if self._inflight + size > self._budget:
+                return False
+            self._inflight += size
+            return True
+
+
+    def _prefetch(self, path):
+        size = 0
+        try:
+            size = _size(path)
+            if size is None or not self._reserve(size):
+                size = 0
+                return False
+
+            _fetch(path)
+            return True
+        except Exception as e:
+            logging.warning("prefetch of {} failed: {}"\
+                            .format(path, e))
+            return False
+        finally:
+            with self._lock:
+                self._inflight -= size
+                self._paths.discard(path)
+
+
+    def shutdown(self):
+        self._pool.shutdown(wait = True)
+
+
+_PREFETCHER = None
+
+
+def get_prefetcher():
+    global _PREFETCHER
+
+    if _PREFETCHER is None:
+        _PREFETCHER = Prefetcher\
+            (budget = int(CONFIGS['worker']['prefetch_budget']) * 2**20,
+             max_workers = int(CONFIGS['worker']['download_threads']))
+
+    return _PREFETCHER
+
+
+@task_received.connect
+def prefetch_inputs(request = None, **kwargs):
+    """Start downloading remote arguments of a received task
+
+    A worker receives tasks ahead of their execution (see celery
+    'worker_prefetch_multiplier'). The handler runs in the main
+    worker process, and downloads go to the local cache shared with
+    the pool processes. A task that starts before its inputs are
+    prefetched waits on the file lock in
+    ?cu.storage.remotestorage_path.RemoteStoragePath.get_locally.
+
+    """
+    if int(CONFIGS['worker']['prefetch_budget']) <= 0:
+        return
+
+    attr = getattr(request.task, 'cu_attr', {})
+    if not attr.get('get_args_locally', False):
+        return
+
+    paths = _collect(request.args, set())
+    paths = _collect(request.kwargs, paths)
+    if paths:
+        get_prefetcher().submit(paths)
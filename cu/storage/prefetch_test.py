@@ -0,0 +1,66 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import threading
+
+from concurrent.futures \
+    import wait, FIRST_COMPLETED
+
+from . import prefetch
+
+
+def test_budget(monkeypatch):
+    release = threading.Event()
+    fetched = []
+    def fetch(path):
+        release.wait(5)
+        fetched.append(path)
+    monkeypatch.setattr(prefetch, '_size', lambda path: 60)
+    monkeypatch.setattr(prefetch, '_fetch', fetch)
+
+    p = prefetch.Prefetcher(budget = 100, max_workers = 2)
+    try:
+        futures = p.submit(['a', 'b'])
+        # first path takes the budget, second one is skipped
+        done, _ = wait(futures, timeout = 5,
+                       return_when = FIRST_COMPLETED)
+        assert [False] == [x.result() for x in done]
+        assert 60 == p.inflight
+        assert [] == p.submit(['a'])
+
+        release.set()
+        assert [False, True] == sorted(x.result(5) for x in futures)
+        assert 1 == len(fetched)
+        assert 0 == p.inflight
+    finally:
+        release.set()
+        p.shutdown()
+
+
+def test_failure(monkeypatch):
+    def fetch(path):
+        raise RuntimeError(path)
+    monkeypatch.setattr(prefetch, '_size', lambda path: 1)
+    monkeypatch.setattr(prefetch, '_fetch', fetch)
+
+    p = prefetch.Prefetcher(budget = 10, max_workers = 1)
+    try:
+        assert [False] == [x.result(5) for x in p.submit(['a'])]
+        assert 0 == p.inflight
+        assert 1 == len(p.submit(['a']))
+    finally:
+        p.shutdown()
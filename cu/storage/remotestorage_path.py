@@ -18,6 +18,7 @@
 
 import os
 import re
+import time
 import logging
 import filelock
 
@@ -29,8 +30,13 @@ from cu.exceptions \
     import NOT_IN_STORAGE, FILE_DISAPPEARED, \
     UNSUPPORTED_REMOTE
 
+from cu.utils import metrics
+from cu.utils.profile_layers \
+    import enabled, profiled
+from cu.utils.tracing \
+    import span
 from cu.utils.serialise \
-    import deserialise
+    import deserialise, serialise_to
 
 
 REGEX = re.compile(r'^(.*):/([A-za-z0-9]*)/(.*)')
@@ -67,6 +73,40 @@ def searchandget_locally(fn, if_deserialise = False):
          .format(path=fn))
 
 
+def _by_storage(rpaths):
+    res = {}
+    for i, x in enumerate(rpaths):
+        res.setdefault(x.remotetype, []).append(i)
+    return res
+
+
+def get_timestamps(rpaths):
+    """Get timestamps of many remote paths at once
+
+    :rpaths: list of RemoteStoragePath
+
+    :return: list of timestamps, None for paths not in the storage
+    """
+    res = [None] * len(rpaths)
+    for idx in _by_storage(rpaths).values():
+        storage = rpaths[idx[0]]._storage
+        times = storage.get_timestamps([rpaths[i].path for i in idx])
+        for i, t in zip(idx, times):
+            res[i] = t
+    return res
+
+
+def update_timestamps(rpaths):
+    """Update timestamps of many remote paths at once
+
+    :rpaths: list of RemoteStoragePath
+
+    """
+    for idx in _by_storage(rpaths).values():
+        rpaths[idx[0]]._storage.update_timestamps\
+            ([rpaths[i].path for i in idx])
+
+
 class RemoteStoragePath:
 
     def __init__(self, path, serialise = 'path',
@@ -126,7 +166,8 @@ class RemoteStoragePath:
         if re.match(r'localmount_.*',self.remotetype):
             from cu.app \
                 import get_LOCAL_STORAGE
-            return get_LOCAL_STORAGE(self.remotetype)
+            res = get_LOCAL_STORAGE(self.remotetype)
+            return profiled(res, 'storage_') if enabled() else res
         else:
             raise UNSUPPORTED_REMOTE\
                 ("unknown remotetype = {}"\
@@ -136,7 +177,8 @@ class RemoteStoragePath:
     @property
     def _localcache(self):
         from cu.app import get_RESULTS_CACHE
-        return get_RESULTS_CACHE()
+        res = get_RESULTS_CACHE()
+        return profiled(res, 'localcache_') if enabled() else res
 
 
     def in_storage(self, ignoreiflocal = False):
@@ -149,13 +191,32 @@ class RemoteStoragePath:
             if self.path in self._localcache:
                 return True
 
-        return self.path in self._storage
+        start = time.perf_counter()
+        res = self.path in self._storage
+        self._observe('exists', time.perf_counter() - start)
+        return res
+
+
+    def _observe(self, op, seconds):
+        metrics.add(op + '_seconds', seconds)
+        metrics.observe('cu_storage_seconds', seconds,
+                        op = op, remotetype = self.remotetype)
+
+
+    def is_local(self):
+        """Check if self is in the local cache
+        """
+        return self.path in self._localcache
 
 
     def get_timestamp(self):
         return self._storage.get_timestamp(self.path)
 
 
+    def get_size(self):
+        return self._storage.get_size(self.path)
+
+
     def update_timestamp(self):
         return self._storage.update_timestamp(self.path)
 
@@ -186,17 +247,45 @@ class RemoteStoragePath:
                      .format(path=self.path,
                              remotetype=self.remotetype))
 
+            start = time.perf_counter()
             self._storage.download(self.path, self.path)
+            self._observe('download', time.perf_counter() - start)
+            metrics.add('download_bytes', os.path.getsize(self.path))
             self._localcache.add(self.path)
             self._localcache.add(self._lock_fn)
             return self._deserialise(if_deserialise)
 
 
     def upload(self):
-        self._storage.upload(self.path, self.path)
+        start = time.perf_counter()
+        with span('upload', path = self.path):
+            self._storage.upload(self.path, self.path)
+        self._observe('upload', time.perf_counter() - start)
+        metrics.add('upload_bytes', os.path.getsize(self.path))
         self._localcache.add(self.path)
 
 
+    def upload_data(self, data):
+        """Serialise data straight into the storage
+
+        Unlike ?upload no local file is written. The local copy is
+        obtained on demand with ?get_locally.
+
+        :data: data to serialise with self.serialisation
+
+        """
+        start = time.perf_counter()
+        with span('upload', path = self.path), \
+             self._storage.upload_to(self.path) as fn:
+            serialise_to(data, fn, self.serialisation)
+            metrics.add('upload_bytes', os.path.getsize(fn))
+        self._observe('upload', time.perf_counter() - start)
+
+        # a stale local copy must not shadow the new file
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
     def link(self, src, timestamp = None):
         if src not in self._storage:
             raise NOT_IN_STORAGE\
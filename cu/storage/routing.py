@@ -0,0 +1,247 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+import socket
+import logging
+import msgpack
+import threading
+
+from celery.signals \
+    import celeryd_after_setup, worker_ready, worker_shutdown
+
+from cu.app \
+    import CONFIGS, get_RESULTS_CACHE
+
+from cu.storage.get_locally \
+    import _collect
+from cu.storage.remotestorage_path \
+    import RemoteStoragePath
+
+from cu.utils.bloom \
+    import BloomFilter
+from cu.utils.redis.client \
+    import get_client
+
+
+_NODES_KEY = 'cu_cache_nodes'
+_SUMMARIES = {'time': 0, 'nodes': {}}
+_WORKER_QUEUES = []
+
+
+def _summary_key(node):
+    return 'cu_cache_summary://{}'.format(node)
+
+
+def _interval():
+    return int(CONFIGS['routing']['summary_interval'])
+
+
+def node_name():
+    return CONFIGS['routing']['node'] or socket.gethostname()
+
+
+def node_queue(queue, node):
+    return '{}@{}'.format(queue, node)
+
+
+def _ttl():
+    # the publisher may miss one update
+    return 2*_interval()
+
+
+def publish_summary(node, queues):
+    """Publish a summary of the local cache
+
+    The summary expires, unless it is published again within 2
+    'summary_interval'. Hence, nodes that are down are not routed to.
+
+    :node: name of the node
+
+    :queues: list of queues the node consumes
+
+    """
+    files = get_RESULTS_CACHE().files()
+    bloom = BloomFilter.for_capacity\
+        (len(files),
+         error_rate = float(CONFIGS['routing']['error_rate']))
+    for fn in files:
+        bloom.add(fn)
+
+    data = msgpack.packb({'queues': list(queues),
+                          'bloom': bloom.to_bytes()})
+    with get_client(CONFIGS['broker_url']).pipeline() as pipe:
+        pipe.set(_summary_key(node), data, ex = _ttl())
+        pipe.sadd(_NODES_KEY, node)
+        pipe.execute()
+
+
+def get_summaries():
+    """Get summaries of nodes caches
+
+    Summaries are refreshed once in 'summary_interval' seconds. The
+    time a summary expires is taken from its TTL in redis, so clocks
+    of nodes do not matter.
+
+    :return: dictionary node -> {'queues': ..., 'bloom': BloomFilter,
+    'expires': time the summary expires}
+    """
+    now = time.time()
+    if now - _SUMMARIES['time'] < _interval():
+        return _SUMMARIES['nodes']
+
+    client = get_client(CONFIGS['broker_url'])
+    nodes = sorted(x.decode() for x in client.smembers(_NODES_KEY))
+    with client.pipeline(transaction = False) as pipe:
+        for node in nodes:
+            pipe.get(_summary_key(node))
+            pipe.pttl(_summary_key(node))
+        data = pipe.execute()
+
+    res = {}
+    for node, x, ttl in zip(nodes, data[::2], data[1::2]):
+        if x is None:
+            # node has not published for a while
+            client.srem(_NODES_KEY, node)
+            continue
+
+        x = msgpack.unpackb(x)
+        res[node] = {'queues': x['queues'],
+                     'bloom': BloomFilter.from_bytes(x['bloom']),
+                     'expires': now + max(ttl, 0) / 1000}
+
+    _SUMMARIES.update({'time': now, 'nodes': res})
+    return res
+
+
+def _size(rpath):
+    return rpath.get_size()
+
+
+def route(queue, args, kwargs):
+    """Choose a queue for a task
+
+    :queue: default queue of the task
+
+    :args, kwargs: arguments of the task
+
+    :return: node-specific queue of the node that caches most bytes
+    of remote arguments, or queue. Nodes, which summaries expired
+    since they were read, are skipped
+    """
+    paths = _collect(args, set())
+    paths = _collect(kwargs, paths)
+    if not paths:
+        return queue
+
+    now = time.time()
+    nodes = {k:v['bloom'] for k,v in get_summaries().items()
+             if queue in v['queues'] and now < v['expires']}
+    if not nodes:
+        return queue
+
+    scores = dict.fromkeys(nodes, 0)
+    for path in paths:
+        rpath = RemoteStoragePath(path)
+        holders = [k for k,v in nodes.items() if rpath.path in v]
+        if not holders:
+            continue
+
+        size = _size(rpath)
+        for k in holders:
+            scores[k] += size
+
+    node = max(sorted(scores), key = lambda x: scores[x])
+    if scores[node] < int(CONFIGS['routing']['min_size']) * 2**20:
+        return queue
+
+    return node_queue(queue, node)
+
+
+class RouteByCache(object):
+    """Route tasks to nodes with cached inputs
+
+    see CONFIGS['routing']
+
+    Example:
+    CELERY_APP(..., base = RouteByCache()(celery.Task))
+
+    """
+
+    def __call__(self, cls):
+        class Wrapped(cls):
+            def apply_async(self, args = None, kwargs = None,
+                            **options):
+                if CONFIGS['routing']['enabled'] \
+                   and options.get('queue') is None \
+                   and not self.app.conf.task_always_eager:
+                    try:
+                        options['queue'] = route\
+                            (self.queue, args or (), kwargs or {})
+                    except Exception as e:
+                        logging.warning\
+                            ("cannot route {}: {}".format(self.name, e))
+
+                return super().apply_async(args, kwargs, **options)
+
+        return Wrapped
+
+
+def _publish_loop(node, queues):
+    while True:
+        try:
+            publish_summary(node, queues)
+        except Exception as e:
+            logging.warning("cannot publish cache summary: {}"\
+                            .format(e))
+        time.sleep(_interval())
+
+
+@celeryd_after_setup.connect
+def _add_node_queues(sender = None, instance = None, **kwargs):
+    if not CONFIGS['routing']['enabled']:
+        return
+
+    queues = instance.app.amqp.queues
+    _WORKER_QUEUES[:] = sorted(queues.consume_from or queues)
+    for x in _WORKER_QUEUES:
+        queues.select_add(node_queue(x, node_name()))
+
+
+@worker_ready.connect
+def _start_publisher(**kwargs):
+    if not CONFIGS['routing']['enabled'] or not _WORKER_QUEUES:
+        return
+
+    threading.Thread(target = _publish_loop,
+                     args = (node_name(), list(_WORKER_QUEUES)),
+                     name = 'cu_routing', daemon = True).start()
+
+
+@worker_shutdown.connect
+def _remove_summary(**kwargs):
+    if not CONFIGS['routing']['enabled'] or not _WORKER_QUEUES:
+        return
+
+    node = node_name()
+    try:
+        with get_client(CONFIGS['broker_url']).pipeline() as pipe:
+            pipe.delete(_summary_key(node))
+            pipe.srem(_NODES_KEY, node)
+            pipe.execute()
+    except Exception as e:
+        logging.warning("cannot remove cache summary: {}".format(e))
@@ -0,0 +1,89 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+import pytest
+
+from cu.utils.bloom \
+    import BloomFilter
+
+from cu.storage.remotestorage_path \
+    import RemoteStoragePath
+
+from . import routing
+
+
+def _summary(queues, paths, expires = None):
+    bloom = BloomFilter.for_capacity(len(paths))
+    for x in paths:
+        bloom.add(RemoteStoragePath(x).path)
+    if expires is None:
+        expires = time.time() + 60
+    return {'queues': queues, 'bloom': bloom, 'expires': expires}
+
+
+def test_route(monkeypatch):
+    a, b, c = ['localmount_dir://input_{}'.format(i) for i in range(3)]
+    sizes = {a: 100, b: 10, c: 1}
+    monkeypatch.setitem(routing.CONFIGS['routing'], 'min_size', 0)
+    monkeypatch.setattr(routing, '_size',
+                        lambda x: sizes[str(x)])
+    monkeypatch.setattr(routing, 'get_summaries', lambda: {
+        'node1': _summary(['celery'], [b, c]),
+        'node2': _summary(['celery'], [a]),
+        'node3': _summary(['gpu'], [a, b, c])})
+
+    assert 'celery@node2' == routing.route('celery', (a, [b]), {})
+    assert 'celery@node1' == routing.route('celery', (), {'x': [b, c]})
+    assert 'gpu@node3' == routing.route('gpu', (c,), {})
+    assert 'other' == routing.route('other', (a,), {})
+    assert 'celery' == routing.route('celery', (1, 'local'), {})
+
+    monkeypatch.setitem(routing.CONFIGS['routing'], 'min_size', 1)
+    assert 'celery' == routing.route('celery', (a,), {})
+
+
+def test_route_expired(monkeypatch):
+    a, b = ['localmount_dir://input_{}'.format(i) for i in range(2)]
+    monkeypatch.setitem(routing.CONFIGS['routing'], 'min_size', 1)
+    monkeypatch.setattr(routing, '_size', lambda x: 2**20)
+    monkeypatch.setattr(routing, 'get_summaries', lambda: {
+        'node1': _summary(['celery'], [a, b], time.time() - 1),
+        'node2': _summary(['celery'], [b])})
+
+    assert 'celery@node2' == routing.route('celery', (a, b), {})
+    assert 'celery' == routing.route('celery', (a,), {})
+
+
+def test_summaries(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    client = fakeredis.FakeStrictRedis()
+    monkeypatch.setattr(routing, 'get_client', lambda url: client)
+    monkeypatch.setattr(routing, '_SUMMARIES', {'time': 0, 'nodes': {}})
+    monkeypatch.setattr(routing, 'get_RESULTS_CACHE', lambda: type\
+        ('cache', (), {'files': lambda self: ['/a', '/b']})())
+
+    routing.publish_summary('node1', ['celery'])
+    client.sadd(routing._NODES_KEY, 'node2')
+
+    res = routing.get_summaries()
+    assert ['node1'] == list(res)
+    assert ['celery'] == res['node1']['queues']
+    assert '/a' in res['node1']['bloom']
+    assert 0 < res['node1']['expires'] - time.time() \
+        <= routing._ttl()
+    assert [b'node1'] == list(client.smembers(routing._NODES_KEY))
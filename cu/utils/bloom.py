@@ -0,0 +1,84 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import math
+import struct
+import hashlib
+
+
+_HEADER = struct.Struct('<QI')
+
+
+class BloomFilter:
+
+
+    def __init__(self, nbits, nhashes, bits = None):
+        """A set of strings with false positives
+
+        :nbits: size of the filter in bits
+
+        :nhashes: number of bits set per item
+
+        :bits: bytes of an existing filter
+
+        """
+        self.nbits = max(8, nbits)
+        self.nhashes = max(1, nhashes)
+        self._bits = bytearray((self.nbits + 7) // 8) \
+            if bits is None else bytearray(bits)
+
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate = 0.01):
+        """Make a filter for a number of items
+
+        :capacity: expected number of items
+
+        :error_rate: probability of a false positive
+
+        """
+        capacity = max(1, capacity)
+        nbits = -capacity * math.log(error_rate) / math.log(2)**2
+        nhashes = nbits / capacity * math.log(2)
+        return cls(int(math.ceil(nbits)), int(round(nhashes)))
+
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'),
+                                 digest_size = 16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return ((h1 + i*h2) % self.nbits for i in range(self.nhashes))
+
+
+    def add(self, item):
+        for x in self._positions(item):
+            self._bits[x // 8] |= 1 << (x % 8)
+
+
+    def __contains__(self, item):
+        return all(self._bits[x // 8] & (1 << (x % 8))
+                   for x in self._positions(item))
+
+
+    def to_bytes(self):
+        return _HEADER.pack(self.nbits, self.nhashes) + bytes(self._bits)
+
+
+    @classmethod
+    def from_bytes(cls, data):
+        nbits, nhashes = _HEADER.unpack_from(data, 0)
+        return cls(nbits, nhashes, data[_HEADER.size:])
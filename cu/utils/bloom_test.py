@@ -0,0 +1,31 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+from .bloom \
+    import BloomFilter
+
+
+def test_bloom(N = 1000):
+    bf = BloomFilter.for_capacity(N, error_rate = 0.01)
+    for i in range(N):
+        bf.add('item_{}'.format(i))
+
+    bf = BloomFilter.from_bytes(bf.to_bytes())
+    assert all('item_{}'.format(i) in bf for i in range(N))
+
+    fp = sum('other_{}'.format(i) in bf for i in range(10*N))
+    assert fp < 0.03 * 10*N
@@ -19,6 +19,8 @@
 import re
 import inspect
 
+from functools import cached_property
+
 
 class _FunDocs:
 
@@ -52,7 +54,7 @@ class _FunDocs:
         return '\n\n'.join(res)
 
 
-    @property
+    @cached_property
     def _docs(self):
         res = {}
 
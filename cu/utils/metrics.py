@@ -0,0 +1,323 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import json
+import time
+import logging
+import resource
+import filelock
+import threading
+import contextlib
+import contextvars
+
+from functools import wraps
+
+from cu.exceptions \
+    import TASK_RUNNING
+
+
+_CURRENT = contextvars.ContextVar('cu_metrics', default = None)
+_NAMES_KEY = 'cu_metrics_names'
+_HISTOGRAMS_KEY = 'cu_histogram_names'
+
+# upper bounds of histogram buckets in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60, '+Inf')
+
+
+class Metrics:
+
+
+    def __init__(self):
+        """Metrics of a running task
+
+        Values are summed, except keys ending with '_max'.
+        Histograms are kept per name and labels.
+        """
+        self.values = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+
+    def add(self, key, value = 1):
+        with self._lock:
+            if key.endswith('_max'):
+                self.values[key] = max(self.values.get(key, value), value)
+            else:
+                self.values[key] = self.values.get(key, 0) + value
+
+
+    def observe(self, name, labels, value):
+        bucket = next(str(x) for x in BUCKETS
+                      if '+Inf' == x or value <= x)
+        with self._lock:
+            res = self.histograms.setdefault(name, {})
+            for k, v in (('{}|{}'.format(labels, bucket), 1),
+                         ('{}|sum'.format(labels), value),
+                         ('{}|count'.format(labels), 1)):
+                res[k] = res.get(k, 0) + v
+
+
+def add(key, value = 1):
+    """Add a value to a metric of the running task
+
+    Nothing is done outside of ?collect.
+
+    :key: name of the metric
+
+    :value: value to add
+
+    """
+    res = _CURRENT.get()
+    if res is not None:
+        res.add(key, value)
+
+
+def observe(name, value, **labels):
+    """Add a value to a histogram
+
+    Nothing is done outside of ?collect.
+
+    :name: name of the histogram
+
+    :value: observed value, see ?BUCKETS
+
+    :labels: labels of the value, e.g. op = 'download'
+
+    """
+    res = _CURRENT.get()
+    if res is not None:
+        res.observe(name, json.dumps(sorted((k, str(v))
+                                            for k, v in labels.items())),
+                    value)
+
+
+@contextlib.contextmanager
+def collect():
+    """Collect metrics added by ?add within the context
+
+    Threads started within the context should run in a copy of the
+    context (see ?contextvars.copy_context), to add their metrics.
+
+    :return: ?Metrics
+    """
+    res = Metrics()
+    token = _CURRENT.set(res)
+    try:
+        yield res
+    finally:
+        _CURRENT.reset(token)
+
+
+def _key(name):
+    return 'cu_metrics://{}'.format(name)
+
+
+def _histogram_key(name):
+    return 'cu_histogram://{}'.format(name)
+
+
+def _local_fn(what = 'metrics', ext = '.json'):
+    from cu.app import CONFIGS
+
+    if CONFIGS['local_root'] is None:
+        return None
+    return os.path.join(CONFIGS['local_root'], what + ext)
+
+
+def _read_file(fn):
+    if not os.path.exists(fn):
+        return {}
+
+    with open(fn) as f:
+        return json.load(f)
+
+
+def _merge(res, values):
+    for k, v in values.items():
+        if k.endswith('_max'):
+            res[k] = max(res.get(k, v), v)
+        else:
+            res[k] = res.get(k, 0) + v
+    return res
+
+
+def store(name, values):
+    """Aggregate metrics of a function call
+
+    Metrics are aggregated in redis, or in the 'metrics.json' file in
+    the local mode (see ?cu.local.configs).
+
+    :name: name of the function
+
+    :values: dictionary of metrics
+
+    """
+    fn = _local_fn()
+    if fn is not None:
+        with filelock.FileLock(fn + '.lock'):
+            res = _read_file(fn)
+            res[name] = _merge(res.get(name, {}), values)
+            with open(fn, 'w') as f:
+                json.dump(res, f)
+        return
+
+    from cu.app import CONFIGS
+    from cu.utils.redis.client import get_client
+
+    client = get_client(CONFIGS['broker_url'])
+    key = _key(name)
+    maxima = {k:v for k,v in values.items() if k.endswith('_max')}
+    if maxima:
+        # maxima are approximate, concurrent updates may race
+        old = client.hmget(key, list(maxima))
+        maxima = {k:v for (k,v), x in zip(maxima.items(), old)
+                  if x is None or v > float(x)}
+
+    with client.pipeline() as pipe:
+        pipe.sadd(_NAMES_KEY, name)
+        for k, v in values.items():
+            if not k.endswith('_max'):
+                pipe.hincrbyfloat(key, k, v)
+        if maxima:
+            pipe.hset(key, mapping = maxima)
+        pipe.execute()
+
+
+def store_histograms(histograms):
+    """Aggregate histograms
+
+    :histograms: see ?Metrics.histograms
+
+    """
+    if not histograms:
+        return
+
+    fn = _local_fn('histograms')
+    if fn is not None:
+        with filelock.FileLock(fn + '.lock'):
+            res = _read_file(fn)
+            for name, values in histograms.items():
+                res[name] = _merge(res.get(name, {}), values)
+            with open(fn, 'w') as f:
+                json.dump(res, f)
+        return
+
+    from cu.app import CONFIGS
+    from cu.utils.redis.client import get_client
+
+    with get_client(CONFIGS['broker_url']).pipeline() as pipe:
+        for name, values in histograms.items():
+            pipe.sadd(_HISTOGRAMS_KEY, name)
+            for k, v in values.items():
+                pipe.hincrbyfloat(_histogram_key(name), k, v)
+        pipe.execute()
+
+
+def _read_redis(names_key, key):
+    from cu.app import CONFIGS
+    from cu.utils.redis.client import get_client
+
+    client = get_client(CONFIGS['broker_url'])
+    names = sorted(x.decode() for x in client.smembers(names_key))
+    with client.pipeline() as pipe:
+        for name in names:
+            pipe.hgetall(key(name))
+        data = pipe.execute()
+
+    return {name: {k.decode(): float(v) for k,v in x.items()}
+            for name, x in zip(names, data)}
+
+
+def get_histograms():
+    """Get aggregated histograms
+
+    :return: dictionary name -> labels (json list of sorted (name,
+    value) pairs) -> dictionary with counts of values in buckets (not
+    cumulative), 'sum' and 'count'
+    """
+    fn = _local_fn('histograms')
+    if fn is not None:
+        with filelock.FileLock(fn + '.lock'):
+            data = _read_file(fn)
+    else:
+        data = _read_redis(_HISTOGRAMS_KEY, _histogram_key)
+
+    res = {}
+    for name, values in data.items():
+        for k, v in values.items():
+            labels, field = k.rsplit('|', 1)
+            res.setdefault(name, {}).setdefault(labels, {})[field] = v
+    return res
+
+
+def get_metrics():
+    """Get aggregated metrics
+
+    :return: dictionary name of the function -> metrics
+    """
+    fn = _local_fn()
+    if fn is not None:
+        with filelock.FileLock(fn + '.lock'):
+            return _read_file(fn)
+
+    return _read_redis(_NAMES_KEY, _key)
+
+
+def _rss_max():
+    # peak resident memory of the process, KiB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def task_metrics(name):
+    """Record metrics of function calls
+
+    Records number of calls, errors and calls rejected as running
+    (see ?cu.utils.one_instance.one_instance), wall and cpu time, peak
+    resident memory of the process, and metrics added during the call
+    with ?add: bytes downloaded and uploaded, cache hits and misses,
+    time spent waiting for locks.
+
+    :name: name of the function in the aggregated metrics, see ?store
+
+    """
+    def wrapper(fun):
+        @wraps(fun)
+        def wrap(*args, **kwargs):
+            with collect() as res:
+                wall, cpu = time.perf_counter(), time.process_time()
+                try:
+                    return fun(*args, **kwargs)
+                except TASK_RUNNING:
+                    res.add('running')
+                    raise
+                except Exception:
+                    res.add('errors')
+                    raise
+                finally:
+                    res.add('calls')
+                    res.add('wall_seconds', time.perf_counter() - wall)
+                    res.add('cpu_seconds', time.process_time() - cpu)
+                    res.add('rss_bytes_max', _rss_max())
+                    try:
+                        store(name, res.values)
+                        store_histograms(res.histograms)
+                    except Exception as e:
+                        logging.warning("cannot store metrics of {}: {}"\
+                                        .format(name, e))
+        return wrap
+    return wrapper
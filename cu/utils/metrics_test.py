@@ -0,0 +1,84 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import pytest
+import contextvars
+
+from concurrent.futures \
+    import ThreadPoolExecutor
+
+from cu.exceptions \
+    import TASK_RUNNING
+
+from . import metrics
+
+
+def test_collect():
+    metrics.add('outside')
+
+    with metrics.collect() as res:
+        metrics.add('bytes', 10)
+        metrics.add('rss_max', 5)
+        metrics.add('rss_max', 3)
+
+        with ThreadPoolExecutor(max_workers = 2) as pool:
+            contexts = [contextvars.copy_context() for _ in range(4)]
+            list(pool.map(lambda c: c.run(metrics.add, 'bytes', 1),
+                          contexts))
+
+    assert {'bytes': 14, 'rss_max': 5} == res.values
+
+
+def test_task_metrics(monkeypatch):
+    stored = []
+    monkeypatch.setattr(metrics, 'store',
+                        lambda name, values: stored.append((name, values)))
+
+    def fun(x):
+        metrics.add('cache_hits')
+        if 'error' == x:
+            raise ValueError(x)
+        if 'running' == x:
+            raise TASK_RUNNING()
+        return x
+    fun = metrics.task_metrics('fun')(fun)
+
+    assert 1 == fun(1)
+    with pytest.raises(ValueError):
+        fun('error')
+    with pytest.raises(TASK_RUNNING):
+        fun('running')
+
+    assert ['fun'] * 3 == [x for x, _ in stored]
+    assert [1, 1, 1] == [x['cache_hits'] for _, x in stored]
+    assert [0, 1, 0] == [x.get('errors', 0) for _, x in stored]
+    assert [0, 0, 1] == [x.get('running', 0) for _, x in stored]
+    assert all(x['wall_seconds'] >= 0 and x['rss_bytes_max'] > 0
+               for _, x in stored)
+
+
+def test_store(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    from cu.app import CONFIGS
+    from cu.utils.redis import client
+    monkeypatch.setitem(client._CLIENTS, CONFIGS['broker_url'],
+                        fakeredis.FakeStrictRedis())
+    monkeypatch.setitem(CONFIGS, 'local_root', None)
+
+    metrics.store('fun', {'calls': 1, 'rss_max': 10})
+    metrics.store('fun', {'calls': 1, 'rss_max': 5})
+    assert {'calls': 2, 'rss_max': 10} == metrics.get_metrics()['fun']
@@ -0,0 +1,113 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import struct
+import zipfile
+
+
+def dump(res, f):
+    """Write numpy data to an open file
+
+    :res: an array (saved as .npy), or a dictionary of arrays (saved
+    as .npz)
+
+    :f: file opened in 'wb' mode
+
+    """
+    import numpy as np
+
+    if isinstance(res, dict):
+        np.savez(f, **res)
+        return
+
+    np.save(f, np.asanyarray(res), allow_pickle = False)
+
+
+def _data_offset(f, info):
+    # the extra field of the local header may differ from the one in
+    # the central directory
+    f.seek(info.header_offset + 26)
+    name_len, extra_len = struct.unpack('<HH', f.read(4))
+    return info.header_offset + 30 + name_len + extra_len
+
+
+def _memmap_member(f, info):
+    """Memory-map an array stored in a .npz file
+
+    np.savez stores arrays uncompressed, so each .npy member is a
+    contiguous chunk of the file.
+
+    :f: .npz file opened in 'rb' mode
+
+    :info: zipfile.ZipInfo of the member
+
+    :return: np.memmap, or None if the member cannot be mapped
+
+    """
+    import numpy as np
+
+    if zipfile.ZIP_STORED != info.compress_type:
+        return None
+
+    f.seek(_data_offset(f, info))
+    version = np.lib.format.read_magic(f)
+    if (1, 0) == version:
+        shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+    elif (2, 0) == version:
+        shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+    else:
+        return None
+
+    if dtype.hasobject or 0 == dtype.itemsize * int(np.prod(shape)):
+        return None
+
+    return np.memmap(f.name, dtype = dtype, mode = 'r',
+                     shape = shape, offset = f.tell(),
+                     order = 'F' if fortran else 'C')
+
+
+def load(f):
+    """Read numpy data from an open file
+
+    Arrays are memory-mapped read-only, so that processes on a node
+    reading the same file share the page cache. The mapping stays
+    valid even if the file is evicted from the local cache. Arrays of
+    a dictionary are mapped from within the .npz file, except empty
+    arrays and arrays of compressed files, which are read.
+
+    :f: file opened in 'rb' mode
+
+    :return: np.memmap or a dictionary of arrays
+
+    """
+    import numpy as np
+
+    res = np.load(f.name, mmap_mode = 'r', allow_pickle = False)
+
+    if not isinstance(res, np.lib.npyio.NpzFile):
+        return res
+
+    with res:
+        data = {}
+        for info in res.zip.infolist():
+            if not info.filename.endswith('.npy'):
+                continue
+            key = info.filename[:-len('.npy')]
+            data[key] = _memmap_member(f, info)
+            if data[key] is None:
+                data[key] = res[key]
+        return data
@@ -0,0 +1,105 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import mmap
+import pickle
+import struct
+
+
+# file layout:
+#   header | buffers table | pickle stream | aligned buffers
+_MAGIC = b'CUPKL5\x00\x01'
+_HEADER = struct.Struct('<8sQQ')
+_ENTRY = struct.Struct('<QQ')
+_ALIGN = 64
+
+
+def _align(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _raw(buf):
+    try:
+        return buf.raw()
+    except BufferError:
+        # non-contiguous buffers cannot be written without a copy
+        return memoryview(memoryview(buf).tobytes())
+
+
+def dump(res, f):
+    """Pickle with protocol 5 and write out-of-band buffers
+
+    Objects that expose pickle.PickleBuffer (e.g. numpy arrays) are
+    not copied into the pickle stream, but written as is after it,
+    each aligned to 64 bytes.
+
+    :res: object to pickle
+
+    :f: file opened in 'wb' mode
+
+    """
+    buffers = []
+    data = pickle.dumps(res, protocol = 5,
+                        buffer_callback = buffers.append)
+    buffers = [_raw(x) for x in buffers]
+
+    offset = _HEADER.size + _ENTRY.size * len(buffers) + len(data)
+    table = []
+    for x in buffers:
+        offset = _align(offset)
+        table += [(offset, x.nbytes)]
+        offset += x.nbytes
+
+    f.write(_HEADER.pack(_MAGIC, len(data), len(buffers)))
+    for entry in table:
+        f.write(_ENTRY.pack(*entry))
+    f.write(data)
+
+    offset = _HEADER.size + _ENTRY.size * len(buffers) + len(data)
+    for (start, size), x in zip(table, buffers):
+        f.write(b'\0' * (start - offset))
+        f.write(x)
+        offset = start + size
+
+
+def load(f):
+    """Read file written with ?cu.utils.pickle5_serialiser.dump
+
+    The file is memory-mapped read-only and out-of-band buffers are
+    passed to pickle as views of the mapping, i.e. large buffers are
+    not copied.
+
+    :f: file opened in 'rb' mode
+
+    """
+    mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    view = memoryview(mm)
+
+    magic, size, nbuffers = _HEADER.unpack_from(mm, 0)
+    if _MAGIC != magic:
+        raise ValueError("{} is not a pickle5 file!".format(f.name))
+
+    offset = _HEADER.size
+    buffers = []
+    for _ in range(nbuffers):
+        start, length = _ENTRY.unpack_from(mm, offset)
+        buffers += [view[start:start + length]]
+        offset += _ENTRY.size
+
+    return pickle.loads(view[offset:offset + size],
+                        buffers = buffers)
@@ -0,0 +1,172 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+import contextvars
+
+from functools import wraps
+
+from cu.utils import metrics
+
+
+_FRAME = contextvars.ContextVar('cu_profile_layers', default = None)
+_ENABLED = []
+
+
+def enabled():
+    """Check if layers are profiled, see CONFIGS['metrics']
+    """
+    if not _ENABLED:
+        from cu.app import CONFIGS
+        _ENABLED.append(bool(CONFIGS['metrics']['profile_layers']))
+    return _ENABLED[0]
+
+
+def enable(flag = True):
+    """Profile layers regardless of the configs
+
+    Only tasks decorated after the call are profiled.
+    """
+    _ENABLED[:] = [flag]
+
+
+class _Frame:
+    __slots__ = ('parent', 'children')
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.children = 0
+
+
+class layer:
+
+
+    def __init__(self, name):
+        """Time a layer of a call
+
+        Time spent in the layer itself, i.e. excluding the nested
+        layers, is added to the metrics of the running task (see
+        ?cu.utils.metrics.add) as 'layer_<name>_seconds', together
+        with the number of calls 'layer_<name>_calls'.
+
+        Note, nested layers running in parallel threads may exceed
+        the time of the enclosing layer. Then, the enclosing layer
+        gets zero time.
+
+        :name: name of the layer
+
+        """
+        self.name = name
+
+
+    def __enter__(self):
+        if not enabled():
+            return self
+
+        self._frame = _Frame(_FRAME.get())
+        self._token = _FRAME.set(self._frame)
+        self._start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, type, value, traceback):
+        if not enabled():
+            return
+
+        total = time.perf_counter() - self._start
+        _FRAME.reset(self._token)
+        if self._frame.parent is not None:
+            self._frame.parent.children += total
+
+        metrics.add('layer_{}_seconds'.format(self.name),
+                    max(0, total - self._frame.children))
+        metrics.add('layer_{}_calls'.format(self.name))
+
+
+def profile_layer(name):
+    """Time every call of a function as a layer, see ?layer
+
+    The function is returned as is, if layers are not profiled.
+
+    :name: name of the layer
+
+    """
+    def wrapper(fun):
+        if not enabled():
+            return fun
+
+        @wraps(fun)
+        def wrap(*args, **kwargs):
+            with layer(name):
+                return fun(*args, **kwargs)
+        return wrap
+    return wrapper
+
+
+class profiled:
+
+
+    def __init__(self, obj, prefix):
+        """Time every method call of an object as a layer
+
+        :obj: object to wrap
+
+        :prefix: layers are named prefix + method name. Membership
+        checks are named prefix + 'contains'
+
+        """
+        self._obj = obj
+        self._prefix = prefix
+
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if not callable(attr):
+            return attr
+
+        @wraps(attr)
+        def wrap(*args, **kwargs):
+            with layer(self._prefix + name):
+                return attr(*args, **kwargs)
+        return wrap
+
+
+    def __contains__(self, item):
+        with layer(self._prefix + 'contains'):
+            return item in self._obj
+
+
+    def __len__(self):
+        return len(self._obj)
+
+
+def breakdown(values):
+    """Breakdown of time by layers
+
+    :values: metrics of a function, see ?cu.utils.metrics.get_metrics
+
+    :return: list of (layer, calls, seconds), sorted by seconds
+    """
+    res = []
+    for k, v in values.items():
+        if not (k.startswith('layer_') and k.endswith('_seconds')):
+            continue
+
+        name = k[len('layer_'):-len('_seconds')]
+        res += [(name, values.get('layer_{}_calls'.format(name), 0), v)]
+
+    return sorted(res, key = lambda x: -x[2])
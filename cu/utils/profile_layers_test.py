@@ -0,0 +1,58 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+
+from . import metrics
+from . import profile_layers
+
+
+def test_layers(monkeypatch):
+    monkeypatch.setattr(profile_layers, '_ENABLED', [True])
+
+    @profile_layers.profile_layer('outer')
+    def outer():
+        time.sleep(0.02)
+        with profile_layers.layer('inner'):
+            time.sleep(0.05)
+        inner = profile_layers.profiled({'a': 1}, 'dict_')
+        return 'a' in inner and 1 == inner.get('a')
+
+    with metrics.collect() as res:
+        assert outer()
+
+    layers = {name: (calls, seconds) for name, calls, seconds
+              in profile_layers.breakdown(res.values)}
+    assert ['dict_contains', 'dict_get', 'inner', 'outer'] == \
+        sorted(layers)
+    assert 0.05 <= layers['inner'][1]
+    # time of the inner layer is excluded
+    assert 0.02 <= layers['outer'][1] < layers['inner'][1]
+    assert 1 == layers['dict_get'][0]
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(profile_layers, '_ENABLED', [False])
+
+    def fun():
+        return 1
+    assert fun is profile_layers.profile_layer('fun')(fun)
+
+    with metrics.collect() as res:
+        with profile_layers.layer('layer'):
+            pass
+    assert {} == res.values
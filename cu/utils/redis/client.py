@@ -0,0 +1,50 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+import redis
+
+from cu.utils.redis.parse_url \
+    import parse_url
+
+
+_CLIENTS = {}
+
+
+def _client(redis_url):
+    if not redis_url.startswith('fakeredis://'):
+        return redis.StrictRedis(**parse_url(redis_url))
+
+    # an in-process stand-in for redis, see ?cu.local.configs
+    import fakeredis
+    return fakeredis.FakeStrictRedis(server = fakeredis.FakeServer())
+
+
+def get_client(redis_url):
+    """Get a redis client
+
+    Clients are shared within a process, hence connections in their
+    pools are reused instead of being opened for every operation.
+
+    :redis_url: how to connect to redis. 'fakeredis://...' urls give
+    an in-process fakeredis
+
+    """
+    if redis_url not in _CLIENTS:
+        _CLIENTS[redis_url] = _client(redis_url)
+    return _CLIENTS[redis_url]
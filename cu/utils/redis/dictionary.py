@@ -15,15 +15,29 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
-
 import json
-import redis
+import msgpack
 
 from cu.utils.float_hash \
     import float_hash
 
-from cu.utils.redis.parse_url \
-    import parse_url
+from cu.utils.redis.client \
+    import get_client
+
+
+_SERIALISERS = {
+    'json': (json.dumps, json.loads),
+    'msgpack': (msgpack.packb,
+                lambda x: msgpack.unpackb(x, raw = False))
+}
+
+
+class HashedKey(str):
+    """A key that is already hashed
+
+    See ?cu.utils.redis.dictionary.Redis_Dictionary.hashed
+    """
+    pass
 
 
 class Redis_Dictionary:
@@ -31,7 +45,8 @@ class Redis_Dictionary:
 
     def __init__(self, name, redis_url,
                  hash_function = float_hash,
-                 expire_time = 7200):
+                 expire_time = 7200,
+                 serialiser = 'json'):
         """A distributed dictionary with redis
 
         :name: name of the set in redis
@@ -41,36 +56,114 @@ class Redis_Dictionary:
         :hash_function: function that produces a hash for keys
 
         :expire_time: time to expire for dictionary items
+
+        :serialiser: how items are stored: 'json' or 'msgpack'
         """
+        if serialiser not in _SERIALISERS:
+            raise RuntimeError\
+                ("serialiser = {} is not supported".format(serialiser))
+
         self._name = name
-        self._client = redis.StrictRedis(**parse_url(redis_url))
+        self._client = get_client(redis_url)
         self._hash = hash_function
         self._expire = expire_time
+        self._dumps, self._loads = _SERIALISERS[serialiser]
+
+
+    def hashed(self, key):
+        """Hash a key
+
+        Hashing complex keys is not cheap. The returned key can be
+        used in place of the original one, and is not hashed again.
+
+        :key: a key
+
+        :return: HashedKey
+
+        """
+        if isinstance(key, HashedKey):
+            return key
+
+        return HashedKey(self._hash(key))
+
+
+    def _rkey(self, key):
+        return self._name + self.hashed(key)
 
 
     def __contains__(self, key):
-        hkey = self._hash(key)
-        return self._client.exists(self._name + hkey)
+        return self._client.exists(self._rkey(key))
 
 
     def __setitem__(self, key, item):
-        hkey = self._hash(key)
-        sitem = json.dumps(item)
-        self._client.set(self._name + hkey, sitem,
+        self._client.set(self._rkey(key), self._dumps(item),
                          ex = self._expire)
 
 
+    def get(self, key, default = None):
+        sitem = self._client.get(self._rkey(key))
+
+        if sitem is None:
+            return default
+
+        return self._loads(sitem)
+
+
     def __getitem__(self, key):
-        hkey = self._hash(key)
+        sitem = self._client.get(self._rkey(key))
 
-        if not self._client.exists(self._name + hkey):
+        if sitem is None:
             raise KeyError\
                 ("'{key}' is not in hset".format(key=key))
 
-        sitem = self._client.get(self._name + hkey)
-        return json.loads(sitem)
+        return self._loads(sitem)
+
+
+    def get_many(self, keys, default = None):
+        """Get several items in one round trip
+
+        :keys: list of keys
+
+        :default: value returned for missing keys
+
+        :return: list of items
+
+        """
+        if not keys:
+            return []
+
+        res = self._client.mget([self._rkey(k) for k in keys])
+        return [default if x is None else self._loads(x) \
+                for x in res]
+
+
+    def set_many(self, items):
+        """Set several items in one round trip
+
+        :items: list of (key, item) pairs
+
+        """
+        pipe = self._client.pipeline(transaction = False)
+        for key, item in items:
+            pipe.set(self._rkey(key), self._dumps(item),
+                     ex = self._expire)
+        pipe.execute()
+
+
+    def count(self):
+        """Number of items
+
+        Keys are counted with SCAN over the prefix of the dictionary,
+        which does not block redis, unlike KEYS. Note, it still takes
+        time proportional to the size of the redis database, and items
+        may be counted twice if the database is rehashed meanwhile.
+
+        :return: int
+
+        """
+        return sum(1 for _ in self._client.scan_iter\
+                   (match = self._name + '*', count = 1000))
 
 
     def __delitem__(self, key):
-        hkey = self._hash(key)
-        self._client.delete(self._name + hkey)
+        self._client.delete(self._rkey(key))
@@ -17,19 +17,23 @@
 
 
 import time
+import pytest
 
-from cu.utils.redis_dictionary \
-    import Redis_Dictionary
+from cu.utils.redis import dictionary
+from cu.utils.redis.dictionary \
+    import Redis_Dictionary, HashedKey
 
-from cu \
-    import REDIS_IP
 
+@pytest.fixture
+def client(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    res = fakeredis.FakeStrictRedis()
+    monkeypatch.setattr(dictionary, 'get_client', lambda url: res)
+    return res
 
-def test_one():
-    d = Redis_Dictionary(name = 'test_one',
-                         host = REDIS_IP,
-                         port = 6379,
-                         db = 0)
+
+def test_one(client):
+    d = Redis_Dictionary(name = 'test_one', redis_url = None)
 
     assert 'one' not in d
     d['one'] = 1
@@ -45,14 +49,51 @@ def test_one():
     del d[(1.2,'two')]
 
 
-def test_timeout():
-    d = Redis_Dictionary(name = 'test_timeout',
-                         host = REDIS_IP,
-                         port = 6379,
-                         db = 0,
-                         expire_time = 5)
+def test_timeout(client):
+    d = Redis_Dictionary(name = 'test_timeout', redis_url = None,
+                         expire_time = 1)
 
     d['one'] = 1
     assert 'one' in d
-    time.sleep(6)
+    time.sleep(1.5)
     assert 'one' not in d
+
+
+def test_many(client):
+    d = Redis_Dictionary(name = 'test_many', redis_url = None)
+
+    assert [] == d.get_many([])
+    d.set_many([('one', 1), ((1.2, 'two'), [2])])
+    assert [1, [2], None] == d.get_many(['one', (1.2, 'two'), 'three'])
+    assert [0] == d.get_many(['three'], default = 0)
+    assert 2 == d.count()
+    assert 0 < client.ttl('test_many' + d.hashed('one'))
+
+
+def test_hashed(client):
+    d = Redis_Dictionary(name = 'test_hashed', redis_url = None)
+
+    key = d.hashed(('method', {'x': 1}))
+    assert isinstance(key, HashedKey)
+    assert key is d.hashed(key)
+
+    d[('method', {'x': 1})] = 1
+    assert key in d
+    assert 1 == d[key]
+    assert [1] == d.get_many([key])
+
+
+def test_serialiser(client):
+    with pytest.raises(RuntimeError):
+        Redis_Dictionary(name = 'test', redis_url = None,
+                         serialiser = 'pickle')
+
+    d = Redis_Dictionary(name = 'test_msgpack', redis_url = None,
+                         serialiser = 'msgpack')
+    d['one'] = {'a': [1, 2], 'b': b'bytes'}
+    assert {'a': [1, 2], 'b': b'bytes'} == d['one']
+    assert {'a': [1, 2], 'b': b'bytes'} == d.get_many(['one'])[0]
+
+    d = Redis_Dictionary(name = 'test_json', redis_url = None)
+    d.set_many([('one', (1, 2))])
+    assert [1, 2] == d['one']
@@ -19,8 +19,13 @@
 import time
 import redis
 
-from cu.utils.redis.parse_url \
-    import parse_url
+from cu.utils import metrics
+from cu.utils.profile_layers \
+    import layer
+from cu.utils.tracing \
+    import add_span
+from cu.utils.redis.client \
+    import get_client
 
 
 class Locked(Exception):
@@ -46,8 +51,7 @@ class RedisLock:
         """
         self.key = key
         self.sleep = sleep
-        self._redis = redis.StrictRedis\
-            (**parse_url(redis_url))
+        self._redis = get_client(redis_url)
         self._lock = redis.lock.Lock\
             (self._redis, self.key, timeout = timeout,
              blocking = 1,
@@ -56,13 +60,23 @@ class RedisLock:
 
 
     def __enter__(self):
-        while not self._lock.acquire():
-            if self.sleep < 0:
-                raise Locked()
-
-            time.sleep(self.sleep)
+        with layer('lock_acquire'):
+            start, started = time.perf_counter(), time.time()
+            waited = False
+            while not self._lock.acquire():
+                if self.sleep < 0:
+                    raise Locked()
+
+                time.sleep(self.sleep)
+                waited = True
+        wait = time.perf_counter() - start
+        if waited:
+            add_span('lock_wait', started, time.time(), key = self.key)
+        metrics.add('lock_wait_seconds', wait)
+        metrics.observe('cu_lock_wait_seconds', wait)
         return True
 
 
     def __exit__(self, type, value, traceback):
-        self._redis.delete(self.key)
+        with layer('lock_release'):
+            self._redis.delete(self.key)
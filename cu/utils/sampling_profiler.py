@@ -0,0 +1,299 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import filelock
+import threading
+
+from functools import wraps
+
+from cu.utils import metrics
+from cu.utils.metrics \
+    import _local_fn
+
+
+_SETTINGS_KEY = 'cu_profiler'
+_SETTINGS = {}
+
+
+class Sampler:
+
+
+    def __init__(self, interval = 0.005, thread_id = None):
+        """Sample stacks of a running thread
+
+        A background thread takes the stack of the sampled thread
+        every interval, see ?sys._current_frames. The sampled thread
+        is not slowed down, except for holding the GIL while a stack
+        is taken.
+
+        :interval: seconds between samples
+
+        :thread_id: thread to sample. By default the calling thread
+
+        """
+        self.interval = interval
+        self.thread_id = threading.get_ident() \
+            if thread_id is None else thread_id
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target = self._run, daemon = True)
+
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format\
+                             (code.co_name, code.co_filename,
+                              code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(stack[::-1])
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+
+    def __exit__(self, type, value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+
+    def collapsed(self):
+        """Stacks in the collapsed format
+
+        Every line is a stack from the outermost frame, separated by
+        ';', and the number of samples, as read by flamegraph.pl or
+        speedscope.
+        """
+        return ''.join('{} {}\n'.format(k, v)
+                       for k, v in sorted(self.stacks.items()))
+
+
+def configure(**settings):
+    """Change settings of the profiler on running workers
+
+    Settings are stored in redis (or in <local_root>/profiler.json in
+    the local mode) and override CONFIGS['profiler']. Workers read
+    them every CONFIGS['profiler']['refresh'] seconds.
+
+    :settings: see CONFIGS['profiler'], e.g. regex = 'mymodule\\.slow'
+
+    :raise re.error: if regex is not a valid regular expression
+
+    """
+    if settings.get('regex'):
+        re.compile(settings['regex'])
+
+    fn = _local_fn('profiler')
+    if fn is not None:
+        with filelock.FileLock(fn + '.lock'):
+            res = _read_local(fn)
+            res.update(settings)
+            with open(fn, 'w') as f:
+                json.dump(res, f)
+        return
+
+    from cu.app import CONFIGS
+    from cu.utils.redis.client import get_client
+
+    get_client(CONFIGS['broker_url'])\
+        .hset(_SETTINGS_KEY, mapping = {k: json.dumps(v)
+                                        for k, v in settings.items()})
+
+
+def _read_local(fn):
+    try:
+        with open(fn) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _read_settings():
+    from cu.app import CONFIGS
+
+    res = dict(CONFIGS['profiler'])
+    fn = _local_fn('profiler')
+    if fn is not None:
+        with filelock.FileLock(fn + '.lock'):
+            res.update(_read_local(fn))
+        return res
+
+    from cu.utils.redis.client import get_client
+
+    try:
+        res.update({k.decode(): json.loads(v) for k, v in
+                    get_client(CONFIGS['broker_url'])\
+                    .hgetall(_SETTINGS_KEY).items()})
+    except Exception as e:
+        logging.warning("cannot read profiler settings: {}".format(e))
+    return res
+
+
+def settings():
+    """Get current settings of the profiler
+
+    see ?configure
+    """
+    now = time.time()
+    if _SETTINGS.get('expire', 0) < now:
+        res = _read_settings()
+        _SETTINGS.update(settings = res,
+                         expire = now + float(res['refresh']))
+    return _SETTINGS['settings']
+
+
+def _if_sample(name, res):
+    if not res['regex'] and not float(res['probability']):
+        return False
+
+    try:
+        if res['regex'] and re.search(res['regex'], name):
+            return True
+    except re.error as e:
+        # e.g. an invalid regex in cu.conf
+        logging.warning("invalid profiler regex {}: {}"\
+                        .format(res['regex'], e))
+        return False
+
+    return random.random() < float(res['probability'])
+
+
+def _profiles_key(name):
+    return 'cu_profiles://{}'.format(name)
+
+
+def store_profile(name, sampler, seconds):
+    """Store the output of a sampler
+
+    The collapsed stacks (see ?Sampler.collapsed) are uploaded to the
+    default remote storage, and the path is added to the list of
+    recent profiles of the function, see ?get_profiles
+
+    :name: name of the function
+
+    :sampler: ?Sampler
+
+    :seconds: wall time of the call
+
+    :return: remote storage path of the profile
+    """
+    from cu.app import CACHE_ODIR, CONFIGS
+    from cu.storage.remotestorage_path import RemoteStoragePath
+
+    rpath = RemoteStoragePath\
+        (os.path.join(CACHE_ODIR, 'profiles', name,
+                      uuid.uuid4().hex + '.collapsed'))
+    os.makedirs(os.path.dirname(rpath.path), exist_ok = True)
+    with open(rpath.path, 'w') as f:
+        f.write(sampler.collapsed())
+    rpath.upload()
+
+    data = {'path': str(rpath), 'wall_seconds': seconds,
+            'samples': sum(sampler.stacks.values()),
+            'time': time.time()}
+    keep = int(settings()['keep'])
+
+    fn = _local_fn('profiles')
+    if fn is not None:
+        with filelock.FileLock(fn + '.lock'):
+            res = _read_local(fn)
+            res[name] = ([data] + res.get(name, []))[:keep]
+            with open(fn, 'w') as f:
+                json.dump(res, f)
+        return str(rpath)
+
+    from cu.utils.redis.client import get_client
+
+    with get_client(CONFIGS['broker_url']).pipeline() as pipe:
+        pipe.lpush(_profiles_key(name), json.dumps(data))
+        pipe.ltrim(_profiles_key(name), 0, keep - 1)
+        pipe.execute()
+    return str(rpath)
+
+
+def get_profiles(name):
+    """Get recent profiles of a function
+
+    :name: name of the function, as in ?cu.utils.metrics.get_metrics
+
+    :return: list of dictionaries with 'path' (remote storage path of
+    the collapsed stacks), 'wall_seconds', 'samples' and 'time',
+    the latest first
+    """
+    fn = _local_fn('profiles')
+    if fn is not None:
+        with filelock.FileLock(fn + '.lock'):
+            return _read_local(fn).get(name, [])
+
+    from cu.app import CONFIGS
+    from cu.utils.redis.client import get_client
+
+    return [json.loads(x) for x in get_client(CONFIGS['broker_url'])\
+            .lrange(_profiles_key(name), 0, -1)]
+
+
+def sampled(name):
+    """Run some calls of a function under ?Sampler
+
+    Calls are sampled according to ?settings. Profiles of calls
+    slower than 'min_seconds' are stored, see ?store_profile, and
+    counted as 'profiles' in the metrics of the call.
+
+    :name: name of the function
+
+    """
+    def wrapper(fun):
+        @wraps(fun)
+        def wrap(*args, **kwargs):
+            res = settings()
+            if not _if_sample(name, res):
+                return fun(*args, **kwargs)
+
+            sampler = Sampler(interval = float(res['interval']))
+            start = time.perf_counter()
+            try:
+                with sampler:
+                    return fun(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                if sampler.stacks and \
+                   seconds >= float(res['min_seconds']):
+                    try:
+                        store_profile(name, sampler, seconds)
+                        metrics.add('profiles')
+                    except Exception as e:
+                        logging.warning\
+                            ("cannot store profile of {}: {}"\
+                             .format(name, e))
+        return wrap
+    return wrapper
@@ -0,0 +1,104 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import time
+import pytest
+
+from . import sampling_profiler
+
+
+def _busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+def test_sampler():
+    with sampling_profiler.Sampler(interval = 0.001) as sampler:
+        _busy(0.1)
+
+    lines = sampler.collapsed().splitlines()
+    assert lines
+    assert any('test_sampler' in x and x.split(';')[-1]\
+               .startswith('_busy') for x in lines)
+    assert sum(sampler.stacks.values()) == \
+        sum(int(x.rsplit(' ', 1)[1]) for x in lines)
+
+
+def _settings(**kwargs):
+    res = {'regex': '', 'probability': 0, 'interval': 0.001,
+           'min_seconds': 0, 'keep': 20, 'refresh': 30}
+    res.update(kwargs)
+    return res
+
+
+def test_sampled(monkeypatch):
+    stored = []
+    monkeypatch.setattr(sampling_profiler, 'store_profile',
+                        lambda name, sampler, seconds: \
+                        stored.append((name, sampler)))
+
+    fun = sampling_profiler.sampled('mod.fun')(_busy)
+
+    monkeypatch.setattr(sampling_profiler, 'settings', _settings)
+    fun(0.01)
+    assert [] == stored
+
+    monkeypatch.setattr(sampling_profiler, 'settings',
+                        lambda: _settings(regex = r'mod\.f'))
+    fun(0.05)
+    assert ['mod.fun'] == [x for x, _ in stored]
+    assert stored[0][1].stacks
+
+    # fast calls are not stored
+    monkeypatch.setattr(sampling_profiler, 'settings',
+                        lambda: _settings(probability = 1,
+                                          min_seconds = 1))
+    fun(0.01)
+    assert 1 == len(stored)
+
+
+def test_sampler_fails(monkeypatch):
+    stored = []
+    monkeypatch.setattr(sampling_profiler, 'store_profile',
+                        lambda *args: stored.append(args))
+    monkeypatch.setattr(sampling_profiler, 'settings',
+                        lambda: _settings(probability = 1))
+
+    def start(self):
+        raise RuntimeError("can't start new thread")
+    monkeypatch.setattr(sampling_profiler.Sampler, '__enter__', start)
+
+    with pytest.raises(RuntimeError, match = 'new thread'):
+        sampling_profiler.sampled('fun')(_busy)(0.01)
+    assert [] == stored
+
+
+def test_invalid_regex(monkeypatch):
+    with pytest.raises(sampling_profiler.re.error):
+        sampling_profiler.configure(regex = 'mod(')
+
+    stored = []
+    monkeypatch.setattr(sampling_profiler, 'store_profile',
+                        lambda *args: stored.append(args))
+    monkeypatch.setattr(sampling_profiler, 'settings',
+                        lambda: _settings(regex = 'mod(',
+                                          probability = 1))
+
+    assert None is sampling_profiler.sampled('mod.fun')(_busy)(0.01)
+    assert [] == stored
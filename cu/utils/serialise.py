@@ -5,14 +5,18 @@ import msgpack
 
 from functools import wraps
 
+from cu.utils import numpy_serialiser, pickle5_serialiser
+
 from cu.utils.files \
     import remove_file, move_file, get_tempfile
 
 
 SUPPORTED = {
     'pickle': (pickle, 'b'),
+    'pickle5': (pickle5_serialiser, 'b'),
     'msgpack': (msgpack, 'b'),
-    'json': (json, '')
+    'json': (json, ''),
+    'numpy': (numpy_serialiser, 'b')
 }
 
 
@@ -24,6 +28,21 @@ def _srl_mode(how, mode='w'):
     return SUPPORTED[how][0], mode + SUPPORTED[how][1]
 
 
+def serialise_to(res, ofn, how):
+    """Serialise data to a file
+
+    :res: data to serialise
+
+    :ofn: string, path to a local file
+
+    :how: string, how to serialise
+
+    """
+    srl, mode = _srl_mode(how, mode='w')
+    with open(ofn, mode) as f:
+        srl.dump(res, f)
+
+
 def serialise(how):
     """A decorator to serialise function return
 
@@ -39,9 +58,7 @@ def serialise(how):
 
             ofn = get_tempfile()
             try:
-                srl, mode = _srl_mode(how, mode='w')
-                with open(ofn, mode) as f:
-                    srl.dump(res, f)
+                serialise_to(res, ofn, how)
                 return ofn
             except Exception as e:
                 remove_file(ofn)
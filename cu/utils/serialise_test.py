@@ -0,0 +1,105 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import pytest
+
+from cu.utils.files \
+    import remove_file
+
+from .serialise \
+    import serialise, _deserialise
+
+
+def _fun(x):
+    return x
+
+
+def test_numpy_array():
+    np = pytest.importorskip('numpy')
+
+    ofn = serialise(how = 'numpy')(_fun)(np.arange(10))
+    try:
+        res = _deserialise(ofn, 'numpy')
+        assert isinstance(res, np.memmap)
+        assert not res.flags.writeable
+        assert (np.arange(10) == res).all()
+    finally:
+        remove_file(ofn)
+
+
+def test_numpy_dictionary():
+    np = pytest.importorskip('numpy')
+
+    ofn = serialise(how = 'numpy')(_fun)\
+        ({'a': np.arange(3), 'b': np.asfortranarray(np.ones((2,3))),
+          'c': np.zeros(0), 'd': np.array(['x', 'yz'])})
+    try:
+        res = _deserialise(ofn, 'numpy')
+        assert ['a', 'b', 'c', 'd'] == sorted(res.keys())
+        assert isinstance(res['a'], np.memmap)
+        assert isinstance(res['b'], np.memmap)
+        assert not res['b'].flags.writeable
+        assert res['b'].flags.f_contiguous
+        assert (np.arange(3) == res['a']).all()
+        assert (np.ones((2,3)) == res['b']).all()
+        assert (0,) == res['c'].shape
+        assert ['x', 'yz'] == list(res['d'])
+    finally:
+        remove_file(ofn)
+
+
+def test_numpy_compressed(tmpdir):
+    np = pytest.importorskip('numpy')
+    from . import numpy_serialiser
+
+    fn = str(tmpdir.join('x.npz'))
+    np.savez_compressed(fn, a = np.arange(3))
+    with open(fn, 'rb') as f:
+        res = numpy_serialiser.load(f)
+    assert not isinstance(res['a'], np.memmap)
+    assert (np.arange(3) == res['a']).all()
+
+
+def test_pickle5():
+    import pickle
+
+    data = {'a': 1, 'b': pickle.PickleBuffer(bytearray(b'x'*1000))}
+    ofn = serialise(how = 'pickle5')(_fun)(data)
+    try:
+        res = _deserialise(ofn, 'pickle5')
+        assert 1 == res['a']
+        assert b'x'*1000 == bytes(res['b'])
+        assert res['b'].readonly
+    finally:
+        remove_file(ofn)
+
+
+def test_pickle5_numpy():
+    np = pytest.importorskip('numpy')
+
+    data = [np.arange(1000), np.ones((10, 10))[:, ::2], 'a']
+    ofn = serialise(how = 'pickle5')(_fun)(data)
+    try:
+        res = _deserialise(ofn, 'pickle5')
+        assert (data[0] == res[0]).all()
+        assert (data[1] == res[1]).all()
+        assert 'a' == res[2]
+        assert not res[0].flags.writeable
+        assert 0 == res[0].ctypes.data % 64
+    finally:
+        remove_file(ofn)
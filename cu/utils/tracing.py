@@ -0,0 +1,456 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import filelock
+import contextlib
+import contextvars
+
+from functools import wraps
+
+from celery.signals \
+    import before_task_publish, task_prerun, task_postrun
+
+from cu.utils.metrics \
+    import _local_fn
+
+
+# (trace_id, span_id) of the running span
+_CURRENT = contextvars.ContextVar('cu_trace', default = None)
+# finished spans waiting to be stored
+_SPANS = contextvars.ContextVar('cu_trace_spans', default = None)
+# state of tasks running in this process, task_id -> (span, tokens)
+_TASKS = {}
+_HEADER = 'cu_trace'
+
+
+def enabled():
+    """Check if new traces are started, see CONFIGS['tracing']
+    """
+    from cu.app import CONFIGS
+    return bool(CONFIGS['tracing']['enabled'])
+
+
+def current():
+    """Get the running span
+
+    :return: (trace_id, span_id) or None outside of a trace
+    """
+    return _CURRENT.get()
+
+
+def _new_span(name, parent, start, attributes):
+    return {'trace_id': parent[0],
+            'span_id': uuid.uuid4().hex[:16],
+            'parent_id': parent[1],
+            'name': name,
+            'start': start,
+            'end': None,
+            'attributes': attributes}
+
+
+def _record(res):
+    spans = _SPANS.get()
+    if spans is not None:
+        spans.append(res)
+        return
+
+    try:
+        store([res])
+    except Exception as e:
+        logging.warning("cannot store span {}: {}".format(res['name'], e))
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Record a span of the running trace
+
+    Nothing is recorded outside of a trace, see ?trace.
+
+    :name: name of the span, e.g. 'input_fetch'
+
+    :attributes: json-serialisable attributes of the span
+
+    :return: the span dictionary, or None outside of a trace
+    """
+    parent = _CURRENT.get()
+    if parent is None:
+        yield None
+        return
+
+    res = _new_span(name, parent, time.time(), attributes)
+    token = _CURRENT.set((res['trace_id'], res['span_id']))
+    try:
+        yield res
+    except Exception as e:
+        res['error'] = "{}: {}".format(type(e).__name__, e)
+        raise
+    finally:
+        _CURRENT.reset(token)
+        res['end'] = time.time()
+        _record(res)
+
+
+def add_span(name, start, end, **attributes):
+    """Record a finished span of the running trace
+
+    Nothing is recorded outside of a trace, see ?trace.
+
+    :start, end: unix time of the start and the end of the span
+
+    :attributes: see ?span
+    """
+    parent = _CURRENT.get()
+    if parent is None:
+        return
+
+    res = _new_span(name, parent, start, attributes)
+    res['end'] = end
+    _record(res)
+
+
+def traced(name):
+    """Decorate a function to run in a span
+
+    see ?span
+    """
+    def wrapper(fun):
+        @wraps(fun)
+        def wrap(*args, **kwargs):
+            with span(name):
+                return fun(*args, **kwargs)
+        return wrap
+    return wrapper
+
+
+@contextlib.contextmanager
+def trace(name, trace_id = None, **attributes):
+    """Start a new trace
+
+    Tasks sent within the trace continue it on workers, see
+    ?propagate_trace. Spans of the trace are collected with
+    ?get_spans, and summarised with ?summary.
+
+    :name: name of the root span
+
+    :trace_id: id of the trace. By default a random uuid
+
+    :attributes: see ?span
+
+    :return: the trace id, or None if tracing is not enabled (see
+    CONFIGS['tracing'])
+    """
+    if not enabled():
+        yield None
+        return
+
+    if trace_id is None:
+        trace_id = str(uuid.uuid4())
+
+    token = _CURRENT.set((trace_id, None))
+    try:
+        with span(name, **attributes):
+            yield trace_id
+    finally:
+        _CURRENT.reset(token)
+
+
+@before_task_publish.connect
+def propagate_trace(headers = None, **kwargs):
+    """Pass the running span to the sent task in the message headers
+    """
+    parent = _CURRENT.get()
+    if parent is None or headers is None:
+        return
+
+    headers[_HEADER] = [parent[0], parent[1], time.time()]
+
+
+@task_prerun.connect
+def start_task_span(task_id = None, task = None, **kwargs):
+    """Continue the trace of the task
+
+    The task span starts when the task is sent, and the time until
+    the task starts on a worker is recorded as a 'queue_wait' span.
+    Spans recorded during the task are stored at once, when the task
+    finishes.
+
+    Eagerly applied tasks continue the running trace.
+
+    """
+    header = task.request.get(_HEADER) if task else None
+    if header:
+        trace_id, parent_id, sent = header
+        parent = (trace_id, parent_id)
+    else:
+        parent, sent = _CURRENT.get(), None
+
+    if parent is None:
+        return
+
+    now = time.time()
+    res = _new_span('task', parent, sent or now,
+                    {'task': task.name, 'task_id': task_id})
+    tokens = (_CURRENT.set((res['trace_id'], res['span_id'])),
+              _SPANS.set([]))
+    _TASKS[task_id] = (res, tokens)
+
+    if sent is not None:
+        add_span('queue_wait', sent, now)
+
+
+@task_postrun.connect
+def end_task_span(task_id = None, state = None, **kwargs):
+    """Finish the task span and store spans of the task
+    """
+    if task_id not in _TASKS:
+        return
+
+    res, (current, spans) = _TASKS.pop(task_id)
+    res['end'] = time.time()
+    res['attributes']['state'] = state
+
+    data = _SPANS.get() + [res]
+    _CURRENT.reset(current)
+    _SPANS.reset(spans)
+    for x in data:
+        _record(x)
+
+
+def _key(trace_id):
+    return 'cu_trace://{}'.format(trace_id)
+
+
+def _local_trace_fn(trace_id):
+    path = _local_fn('traces', '')
+    if path is None:
+        return None
+
+    # trace ids come from requests
+    if not re.fullmatch(r'[\w-]+', trace_id):
+        raise ValueError("invalid trace_id = {}".format(trace_id))
+
+    return os.path.join(path, trace_id + '.jsonl')
+
+
+def _prune(path, expire):
+    now = time.time()
+    for x in os.listdir(path):
+        fn = os.path.join(path, x)
+        try:
+            if now - os.path.getmtime(fn) > expire:
+                os.remove(fn)
+        except FileNotFoundError:
+            pass
+
+
+def store(spans):
+    """Store finished spans
+
+    Spans are kept in redis for CONFIGS['tracing']['expire'] seconds.
+    In the local mode, spans are appended to
+    <local_root>/traces/<trace_id>.jsonl, and files not updated for
+    that long are removed, when a new trace is stored.
+
+    :spans: list of span dictionaries, see ?span
+
+    """
+    if not spans:
+        return
+
+    from cu.app import CONFIGS
+
+    expire = int(CONFIGS['tracing']['expire'])
+    traces = {}
+    for x in spans:
+        traces.setdefault(x['trace_id'], []).append(x)
+
+    if _local_fn('traces') is not None:
+        for trace_id, data in traces.items():
+            fn = _local_trace_fn(trace_id)
+            if not os.path.exists(fn):
+                os.makedirs(os.path.dirname(fn), exist_ok = True)
+                _prune(os.path.dirname(fn), expire)
+            with filelock.FileLock(fn + '.lock'):
+                with open(fn, 'a') as f:
+                    for x in data:
+                        f.write(json.dumps(x) + '\n')
+        return
+
+    from cu.utils.redis.client import get_client
+
+    with get_client(CONFIGS['broker_url']).pipeline() as pipe:
+        for x in spans:
+            pipe.rpush(_key(x['trace_id']), json.dumps(x))
+        for trace_id in traces:
+            pipe.expire(_key(trace_id), expire)
+        pipe.execute()
+
+
+def get_spans(trace_id):
+    """Get stored spans of a trace
+
+    :trace_id: see ?trace
+
+    :return: list of span dictionaries ordered by start time
+    """
+    fn = _local_trace_fn(trace_id)
+    if fn is not None:
+        try:
+            with filelock.FileLock(fn + '.lock'):
+                with open(fn) as f:
+                    res = [json.loads(x) for x in f]
+        except FileNotFoundError:
+            res = []
+    else:
+        from cu.app import CONFIGS
+        from cu.utils.redis.client import get_client
+
+        res = [json.loads(x) for x in get_client(CONFIGS['broker_url'])\
+               .lrange(_key(trace_id), 0, -1)]
+
+    return sorted(res, key = lambda x: x['start'])
+
+
+def _ends(spans, children):
+    # a span ends, when its last descendant ends. Tasks are sent
+    # asynchronously and may outlive the span that sent them
+    res = {}
+
+    def end(x):
+        if x['span_id'] not in res:
+            res[x['span_id']] = max\
+                ([x['end']] + [end(y) for y in
+                               children.get(x['span_id'], [])])
+        return res[x['span_id']]
+
+    for x in spans:
+        end(x)
+    return res
+
+
+def critical_path(spans):
+    """Compute the critical path of a trace
+
+    Walking back from the end of a span, the time is attributed to
+    the child that finished last, and recursively to its children,
+    until the start of that child. The rest of the time is attributed
+    to the span itself.
+
+    :spans: list of spans, see ?get_spans
+
+    :return: list of (span, seconds) in the order of time. A span
+    appears once for every interval it is on the path between
+    its children
+    """
+    ids = set(x['span_id'] for x in spans)
+    children = {}
+    for x in spans:
+        parent = x['parent_id'] if x['parent_id'] in ids else None
+        children.setdefault(parent, []).append(x)
+    ends = _ends(spans, children)
+
+    res = []
+
+    def walk(x, end):
+        cur = min(ends[x['span_id']], end)
+        for y in sorted(children.get(x['span_id'], []),
+                        key = lambda y: ends[y['span_id']],
+                        reverse = True):
+            if cur <= x['start']:
+                break
+            if y['start'] >= cur:
+                continue
+            y_end = min(ends[y['span_id']], cur)
+            if cur > y_end:
+                add(x, cur - y_end)
+            walk(y, y_end)
+            cur = max(y['start'], x['start'])
+        if cur > x['start']:
+            add(x, cur - x['start'])
+
+    def add(x, seconds):
+        if res and res[-1][0] is x:
+            res[-1] = (x, res[-1][1] + seconds)
+            return
+        res.append((x, seconds))
+
+    roots = children.get(None, [])
+    if roots:
+        root = max(roots, key = lambda x: ends[x['span_id']])
+        walk(root, ends[root['span_id']])
+
+    return res[::-1]
+
+
+def summary(trace_id):
+    """Summarise a trace
+
+    :trace_id: see ?trace
+
+    :return: dictionary with
+        - 'duration': seconds from the start of the trace to the end
+          of its last span
+        - 'critical_path': list of dictionaries with 'name', 'task'
+          (name of the task running the span), 'span_id' and
+          'seconds', see ?critical_path
+        - 'by_name': seconds on the critical path per span name,
+          sorted descending
+        - 'spans': all spans of the trace
+    """
+    spans = get_spans(trace_id)
+    path = critical_path(spans)
+
+    parents = {x['span_id']: x for x in spans}
+
+    def task(x):
+        while x is not None and 'task' not in x['attributes']:
+            x = parents.get(x['parent_id'])
+        return None if x is None else x['attributes']['task']
+
+    by_name = {}
+    for x, seconds in path:
+        by_name[x['name']] = by_name.get(x['name'], 0) + seconds
+
+    return {'trace_id': trace_id,
+            'duration': sum(seconds for _, seconds in path),
+            'critical_path': [{'name': x['name'],
+                               'task': task(x),
+                               'span_id': x['span_id'],
+                               'seconds': seconds}
+                              for x, seconds in path],
+            'by_name': dict(sorted(by_name.items(),
+                                   key = lambda x: -x[1])),
+            'spans': spans}
+
+
+def export(trace_id, fn):
+    """Write a trace and its summary to a json file
+
+    see ?summary
+
+    :return: fn
+    """
+    with open(fn, 'w') as f:
+        json.dump(summary(trace_id), f, indent = 1)
+    return fn
@@ -0,0 +1,109 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import os
+import time
+import pytest
+
+from cu.app \
+    import CONFIGS
+
+from . import tracing
+
+
+def _span(name, span_id, parent_id, start, end):
+    return {'trace_id': 't', 'span_id': span_id, 'parent_id': parent_id,
+            'name': name, 'start': start, 'end': end, 'attributes': {}}
+
+
+def test_critical_path():
+    spans = [_span('root', 'r', None, 0, 1),
+             # runs after the root span has ended
+             _span('task', 'a', 'r', 0.5, 5),
+             _span('fetch', 'b', 'a', 1, 2),
+             _span('compute', 'c', 'a', 1.5, 4),
+             _span('task', 'd', 'r', 0.5, 3)]
+
+    res = [(x['span_id'], y) for x, y in tracing.critical_path(spans)]
+    assert [('r', 0.5), ('a', 0.5), ('b', 0.5),
+            ('c', 2.5), ('a', 1)] == res
+    assert 5 == sum(y for _, y in res)
+
+
+def test_propagate(monkeypatch):
+    stored = []
+    monkeypatch.setattr(tracing, 'store', stored.extend)
+    monkeypatch.setitem(CONFIGS['tracing'], 'enabled', True)
+
+    class Task:
+        name = 'fun'
+        request = {}
+
+    headers = {}
+    with tracing.trace('root') as trace_id:
+        with tracing.span('child'):
+            tracing.propagate_trace(headers = headers)
+    assert ['child', 'root'] == [x['name'] for x in stored]
+    assert trace_id == headers['cu_trace'][0]
+    assert stored[0]['span_id'] == headers['cu_trace'][1]
+
+    # a task on a worker continues the trace
+    Task.request = {'cu_trace': headers['cu_trace']}
+    tracing.start_task_span(task_id = 'x', task = Task)
+    with tracing.span('compute'):
+        time.sleep(0.01)
+    assert 2 == len(stored)
+    tracing.end_task_span(task_id = 'x', state = 'SUCCESS')
+    assert tracing.current() is None
+
+    spans = {x['name']: x for x in stored}
+    assert spans['child']['span_id'] == spans['task']['parent_id']
+    assert spans['task']['span_id'] == spans['queue_wait']['parent_id']
+    assert spans['task']['span_id'] == spans['compute']['parent_id']
+    assert spans['task']['start'] == headers['cu_trace'][2]
+    assert 'SUCCESS' == spans['task']['attributes']['state']
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setitem(CONFIGS['tracing'], 'enabled', False)
+
+    with tracing.trace('root') as trace_id, \
+         tracing.span('child') as res:
+        assert trace_id is None and res is None
+        assert tracing.current() is None
+
+
+def test_store_local(monkeypatch, tmpdir):
+    monkeypatch.setitem(CONFIGS, 'local_root', str(tmpdir))
+    monkeypatch.setitem(CONFIGS['tracing'], 'expire', 60)
+
+    spans = [_span('root', 'r', None, 0, 1),
+             _span('task', 'a', 'r', 0.5, 5)]
+    tracing.store(spans[::-1])
+    assert spans == tracing.get_spans('t')
+    assert [] == tracing.get_spans('other')
+
+    # old traces are removed, when a new trace is stored
+    old = str(tmpdir.join('traces', 't.jsonl'))
+    os.utime(old, (time.time() - 120,) * 2)
+    tracing.store([dict(spans[0], trace_id = 'new')])
+    assert not os.path.exists(old)
+    assert 1 == len(tracing.get_spans('new'))
+
+    with pytest.raises(ValueError):
+        tracing.get_spans('../t')
@@ -0,0 +1,142 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import re
+import json
+import time
+
+from celery.result \
+    import AsyncResult
+from celery.states \
+    import READY_STATES
+
+from cu.app \
+    import CELERY_APP, get_Tasks_Queues
+
+from cu.webserver.utils \
+    import call_batch
+
+
+def _event(name, data):
+    return "event: {}\ndata: {}\n\n".format(name, json.dumps(data))
+
+
+def _is_running(res):
+    return isinstance(res, dict) \
+        and isinstance(res.get('results'), dict) \
+        and 'task is running' == res['results'].get('message')
+
+
+def _job_id(method, args):
+    job_id = get_Tasks_Queues().get((method, args))
+    if job_id is None:
+        return None
+
+    m = re.match('generate_task_queue://(.*)', job_id)
+    if m:
+        return m.groups()[0]
+    return job_id
+
+
+def _wait_job(job_id, state, timeout):
+    """Wait until state of a job changes
+
+    The celery redis backend publishes every state change of a task
+    to a channel named as the result key of the task.
+
+    :job_id: celery task id
+
+    :state: last seen state
+
+    :timeout: maximum seconds to wait
+
+    """
+    client = getattr(CELERY_APP.backend, 'client', None)
+    if job_id is None or not hasattr(client, 'pubsub'):
+        time.sleep(min(timeout, 1))
+        return
+
+    pubsub = client.pubsub(ignore_subscribe_messages = True)
+    try:
+        pubsub.subscribe(CELERY_APP.backend.get_key_for_task(job_id))
+
+        # state could have changed before the subscription
+        if state != AsyncResult(job_id).state:
+            return
+
+        # get_message returns None right away on the subscribe
+        # confirmation
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if pubsub.get_message\
+               (timeout = deadline - time.time()) is not None:
+                return
+    finally:
+        pubsub.close()
+
+
+def method_events(method, args, call = None, serve_type = 'path',
+                  timeout = 3600, keepalive = 15):
+    """Generate server-sent events for a method call
+
+    The call is submitted if needed. A 'state' event is sent on every
+    state change of the call, and a final 'result' event contains the
+    results (see ?cu.webserver.utils.serve). The webserver is notified
+    by redis, hence neither the client nor the webserver poll. Results
+    are only looked up again, when a job of the call is finished.
+
+    :method, args, call: see ?cu.webserver.utils.call_method
+
+    :serve_type: see ?cu.webserver.utils.serve
+
+    :timeout: seconds after which a 'timeout' event is sent and the
+    stream is closed
+
+    :keepalive: seconds between keep-alive comments
+
+    """
+    def results():
+        return call_batch(method = method, args_list = [args],
+                          call = call, serve_type = serve_type)[0]
+
+    deadline = time.time() + timeout
+    state = None
+
+    res = results()
+    while _is_running(res):
+        job_id = _job_id(method, args)
+        new = None if job_id is None else AsyncResult(job_id).state
+        if state != new:
+            state = new
+            yield _event('state', {'state': state})
+
+        if job_id is None or state in READY_STATES:
+            res = results()
+            # generate_task_queue is done, follow the generated job
+            if not _is_running(res) or job_id != _job_id(method, args):
+                continue
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            yield _event('timeout', {'timeout': timeout})
+            return
+
+        _wait_job(job_id, state, min(keepalive, remaining))
+        yield ": keep-alive\n\n"
+
+    yield _event('result', res)
@@ -0,0 +1,119 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import time
+
+from . import events
+
+
+_RUNNING = {'results': {'message': 'task is running'}}
+
+
+def test_method_events(monkeypatch):
+    # generate_task_queue job 'g' generates job 'j'
+    states = {'g': ['PENDING', 'SUCCESS'], 'j': ['STARTED', 'SUCCESS']}
+    job = ['g']
+    calls = []
+
+    def call_batch(**kwargs):
+        calls.append(job[0])
+        if 'SUCCESS' != states[job[0]][0]:
+            return [_RUNNING]
+        if 'g' == job[0]:
+            job[0] = 'j'
+            return [_RUNNING]
+        return [{'storage_fn': 'result'}]
+
+    class AsyncResult:
+
+        def __init__(self, job_id):
+            self.state = states[job_id][0]
+
+    def wait_job(job_id, state, timeout):
+        if len(states[job_id]) > 1:
+            states[job_id].pop(0)
+
+    monkeypatch.setattr(events, 'call_batch', call_batch)
+    monkeypatch.setattr(events, 'AsyncResult', AsyncResult)
+    monkeypatch.setattr(events, '_job_id', lambda method, args: job[0])
+    monkeypatch.setattr(events, '_wait_job', wait_job)
+
+    res = [x for x in events.method_events('m', {}, call = object())
+           if not x.startswith(':')]
+    assert [events._event('state', {'state': x})
+            for x in ('PENDING', 'SUCCESS', 'STARTED', 'SUCCESS')] + \
+        [events._event('result', {'storage_fn': 'result'})] == res
+    # results are looked up only when a job is done
+    assert ['g', 'g', 'j'] == calls
+
+
+class _PubSub:
+
+
+    def __init__(self, messages):
+        # None is returned at once, as for the subscribe confirmation
+        self.messages = [None] + messages
+
+
+    def subscribe(self, channel):
+        pass
+
+
+    def get_message(self, timeout):
+        if self.messages:
+            return self.messages.pop(0)
+        time.sleep(timeout)
+        return None
+
+
+    def close(self):
+        pass
+
+
+def _backend(monkeypatch, messages):
+    class Client:
+        def pubsub(self, ignore_subscribe_messages):
+            return _PubSub(messages)
+
+    class Backend:
+        client = Client()
+        get_key_for_task = str
+
+    class App:
+        backend = Backend()
+
+    class AsyncResult:
+        state = 'PENDING'
+
+        def __init__(self, job_id):
+            pass
+
+    monkeypatch.setattr(events, 'CELERY_APP', App())
+    monkeypatch.setattr(events, 'AsyncResult', AsyncResult)
+
+
+def test_wait_job(monkeypatch):
+    _backend(monkeypatch, [])
+    start = time.time()
+    events._wait_job('j', 'PENDING', 0.2)
+    assert time.time() - start >= 0.2
+
+    _backend(monkeypatch, [{'type': 'message'}])
+    start = time.time()
+    events._wait_job('j', 'PENDING', 5)
+    assert time.time() - start < 1
@@ -0,0 +1,180 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import time
+import bottle
+import logging
+
+from functools import wraps
+
+from cu.app \
+    import get_RESULTS_CACHE, get_Tasks_Queues
+
+from cu.utils import metrics
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\')\
+                     .replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+
+    return '{' + ','.join('{}="{}"'.format(k, _escape(v))
+                          for k, v in labels) + '}'
+
+
+def _parse_labels(labels):
+    return [tuple(x) for x in json.loads(labels)]
+
+
+def _metric(name, mtype, help, samples):
+    """Format a metric in the prometheus text format
+
+    :samples: list of (suffix, labels, value), where labels is a list
+    of (name, value)
+    """
+    res = ['# HELP {} {}'.format(name, help),
+           '# TYPE {} {}'.format(name, mtype)]
+    for suffix, labels, value in samples:
+        res += ['{}{}{} {}'.format(name, suffix, _labels(labels),
+                                   float(value))]
+    return res
+
+
+def _cache_metrics():
+    cache = get_RESULTS_CACHE()
+    return \
+        _metric('cu_cache_size_bytes', 'gauge',
+                'size of files in the local cache',
+                [('', [], cache.size())]) + \
+        _metric('cu_cache_limit_bytes', 'gauge',
+                'maximum size of the local cache',
+                [('', [], cache.maxsize)]) + \
+        _metric('cu_cache_usage_ratio', 'gauge',
+                'used fraction of the local cache',
+                [('', [], cache.size() / cache.maxsize)]) + \
+        _metric('cu_cache_files', 'gauge',
+                'number of files in the local cache',
+                [('', [], len(cache))]) + \
+        _metric('cu_cache_evictions_total', 'counter',
+                'number of files evicted from the local cache',
+                [('', [], cache.evictions())])
+
+
+def _queues_metrics():
+    return _metric('cu_tasks_queues_size', 'gauge',
+                   'number of calls tracked by the webserver',
+                   [('', [], get_Tasks_Queues().count())])
+
+
+def _histogram_metrics():
+    res = []
+    for name, data in sorted(metrics.get_histograms().items()):
+        samples = []
+        for labels, values in sorted(data.items()):
+            labels = _parse_labels(labels)
+            total = 0
+            for bucket in metrics.BUCKETS:
+                total += values.get(str(bucket), 0)
+                samples += [('_bucket', labels + [('le', bucket)], total)]
+            samples += [('_sum', labels, values.get('sum', 0)),
+                        ('_count', labels, values.get('count', 0))]
+        res += _metric(name, 'histogram', name.replace('_', ' '),
+                       samples)
+    return res
+
+
+def _task_metrics():
+    data = metrics.get_metrics()
+    keys = sorted(set(k for x in data.values() for k in x))
+
+    res = []
+    for key in keys:
+        samples = [('', [('function', name)], values[key])
+                   for name, values in sorted(data.items())
+                   if key in values]
+        if key.endswith('_max'):
+            res += _metric('cu_task_' + key, 'gauge',
+                           'maximum of {} per task'.format(key),
+                           samples)
+        else:
+            res += _metric('cu_task_{}_total'.format(key), 'counter',
+                           'sum of {} per task'.format(key), samples)
+    return res
+
+
+def prometheus_text():
+    """Metrics in the prometheus text format
+
+    Includes the local cache of the webserver node, size of the
+    Tasks_Queues, histograms of storage operations, lock waits and
+    webserver requests (see ?cu.utils.metrics.observe), and metrics
+    of tasks (see ?cu.utils.metrics.task_metrics).
+    """
+    res = []
+    for fun in (_cache_metrics, _queues_metrics,
+                _histogram_metrics, _task_metrics):
+        try:
+            res += fun()
+        except Exception as e:
+            logging.warning("cannot collect metrics {}: {}"\
+                            .format(fun.__name__, e))
+
+    return '\n'.join(res) + '\n'
+
+
+_METHOD = 'cu.method'
+
+
+def set_method(method):
+    """Label metrics of the current request with a method
+
+    :method: method, that is resolved and allowed
+    """
+    bottle.request.environ[_METHOD] = method
+
+
+def request_metrics(callback):
+    """Bottle plugin recording latency of requests
+
+    Latency is recorded per route and method in the
+    'cu_request_seconds' histogram, together with histograms observed
+    during the request. The method is only known for requests that
+    resolved an allowed method, see ?set_method. Hence, the number of
+    labels does not depend on what clients send.
+    """
+    @wraps(callback)
+    def wrap(*args, **kwargs):
+        with metrics.collect() as res:
+            start = time.perf_counter()
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                metrics.observe\
+                    ('cu_request_seconds', time.perf_counter() - start,
+                     route = bottle.request.route.rule,
+                     method = bottle.request.environ.get(_METHOD, ''))
+                try:
+                    metrics.store_histograms(res.histograms)
+                except Exception as e:
+                    logging.warning("cannot store request metrics: {}"\
+                                    .format(e))
+    return wrap
@@ -0,0 +1,71 @@
+#
+# This file is part of the celery-utils (https://github.com/e.sovetkin/celery-utils).
+# Copyright (c) 2022 Jenya Sovetkin.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import pytest
+
+from . import metrics
+
+
+def test_histogram(monkeypatch):
+    monkeypatch.setattr(metrics.metrics, 'get_histograms', lambda: {
+        'cu_storage_seconds': {
+            '[["op", "a,b=c"]]': {'0.001': 2, '1': 1,
+                                  'sum': 0.5, 'count': 3}}})
+
+    res = metrics._histogram_metrics()
+    assert '# TYPE cu_storage_seconds histogram' in res
+    assert 'cu_storage_seconds_bucket{op="a,b=c",le="0.001"} 2.0' in res
+    assert 'cu_storage_seconds_bucket{op="a,b=c",le="0.5"} 2.0' in res
+    assert 'cu_storage_seconds_bucket{op="a,b=c",le="+Inf"} 3.0' in res
+    assert 'cu_storage_seconds_count{op="a,b=c"} 3.0' in res
+
+
+def test_task_metrics(monkeypatch):
+    monkeypatch.setattr(metrics.metrics, 'get_metrics', lambda: {
+        'a"b': {'calls': 2, 'rss_bytes_max': 10},
+        'c': {'calls': 1}})
+
+    res = metrics._task_metrics()
+    assert 'cu_task_calls_total{function="a\\"b"} 2.0' in res
+    assert 'cu_task_calls_total{function="c"} 1.0' in res
+    assert '# TYPE cu_task_rss_bytes_max gauge' in res
+
+
+def test_labels():
+    with metrics.metrics.collect() as res:
+        metrics.metrics.observe('x', 0.002, op = 'a,"b"\n', n = 1)
+
+    labels = {k.rsplit('|', 1)[0] for k in res.histograms['x']}
+    assert 1 == len(labels)
+    assert '{n="1",op="a,\\"b\\"\\n"}' == \
+        metrics._labels(metrics._parse_labels(labels.pop()))
+
+
+def test_queues(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    from cu.utils.redis import dictionary
+
+    monkeypatch.setattr(dictionary, 'get_client',
+                        lambda url: fakeredis.FakeStrictRedis())
+    queues = dictionary.Redis_Dictionary\
+        (name = 'queues_test', redis_url = None)
+    for i in range(3):
+        queues[i] = i
+    queues._client.set('other', 1)
+    monkeypatch.setattr(metrics, 'get_Tasks_Queues', lambda: queues)
+
+    assert 'cu_tasks_queues_size 3.0' in metrics._queues_metrics()
@@ -36,10 +36,22 @@ from cu.webserver.utils \
 
 from cu.webserver.utils \
     import format_help, return_exception, \
-    call_method, parse_args, serve
+    call_method, call_batch, parse_args, serve
 
 from cu.webserver.upload \
-    import upload_request_data
+    import upload_request_data, lookup_upload
+
+from cu.webserver.events \
+    import method_events
+
+from cu.webserver.metrics \
+    import prometheus_text, request_metrics, set_method
+
+from cu.utils.tracing \
+    import summary
+
+from cu.utils.sampling_profiler \
+    import get_profiles
 
 
 _webserver_args = {
@@ -50,6 +62,9 @@ _webserver_args = {
      options:
          - 'file': binary data
 
+           the file is streamed and supports HTTP 'Range' requests,
+           e.g. to resume an interrupted download
+
          - 'path': {"storage_fn": <remote storage path>}
 
          - 'deserialise': {"results": <deserialised data>}
@@ -60,19 +75,28 @@ _webserver_args = {
            webserver.""")}
 
 
-def _check_allowed(method):
-    if not isinstance(CONFIGS['app']['allowed_imports'], list):
+def _compile_allowed(allowed_imports):
+    if not isinstance(allowed_imports, list):
         raise RuntimeError\
             ("CONFIGS['app']['allowed_imports'] should be a list!")
 
-    for x in CONFIGS['app']['allowed_imports']:
-        if re.match(x, method):
+    return [re.compile(x) for x in allowed_imports]
+
+
+_ALLOWED_IMPORTS = _compile_allowed(CONFIGS['app']['allowed_imports'])
+
+# method -> (function, calldocs including the _webserver_args)
+_METHODS = {}
+
+
+def _check_allowed(method):
+    for x in _ALLOWED_IMPORTS:
+        if x.match(method):
             return True
     return False
 
 
 def _method2module(method):
-    method = method.replace('/','.')
     if not _check_allowed(method):
         raise RuntimeError\
             ('{} does match to the allowed imports!'\
@@ -81,6 +105,58 @@ def _method2module(method):
     return import_function(method)
 
 
+def _method_info(method):
+    """Resolve a method and its calldocs
+
+    Results are kept for the lifetime of the webserver worker, so a
+    request only needs a dictionary lookup.
+
+    :method: method path, with '/' or '.' as separators
+
+    :return: (function, calldocs)
+
+    """
+    method = method.replace('/','.')
+    if method in _METHODS:
+        return _METHODS[method]
+
+    fun = _method2module(method)
+    docs = calldocs(fun)
+    docs['args'].update(_webserver_args)
+    _METHODS[method] = (fun, docs)
+    return _METHODS[method]
+
+
+def _request_method(method):
+    """Resolve a method of the current request
+
+    see ?_method_info
+    """
+    res = _method_info(method)
+    set_method(method.replace('/','.'))
+    return res
+
+
+def _preload_methods(methods):
+    for method in methods:
+        try:
+            _method_info(method)
+        except Exception as e:
+            logging.warning("cannot preload method {}: {}: {}"\
+                            .format(method, type(e).__name__, e))
+
+
+def _parse_args(args, docs):
+    args = parse_args(data = args, defaults = docs['args'])
+
+    webserver_args = {}
+    for k in _webserver_args.keys():
+        webserver_args[k] = args[k]
+        del args[k]
+
+    return args, webserver_args
+
+
 def _process_request_files(request_files):
     res = {}
     for fn in request_files.keys():
@@ -88,6 +164,10 @@ def _process_request_files(request_files):
     return res
 
 
+if CONFIGS['metrics']['enabled']:
+    bottle.install(request_metrics)
+
+
 @bottle.error(404)
 def error404(error):
     return {'results': str(error)}
@@ -96,16 +176,108 @@ def error404(error):
 @bottle.route('/api/help/<method:path>', method=['GET','POST'])
 def get_help(method):
     try:
-        res = calldocs(_method2module(method))
-        res['args'].update(_webserver_args)
+        _, res = _request_method(method)
     except Exception as e:
         return return_exception(e)
 
     return {'results': format_help(res)}
 
 
-@bottle.route('/api/<method_str:path>', method=['GET','POST'])
-def do_method(method_str):
+@bottle.route('/api/metrics', method=['GET'])
+def get_metrics():
+    """Metrics in the prometheus text format
+
+    see ?cu.webserver.metrics.prometheus_text
+    """
+    bottle.response.content_type = 'text/plain; version=0.0.4'
+    return prometheus_text()
+
+
+@bottle.route('/api/trace/<trace_id>', method=['GET'])
+def get_trace(trace_id):
+    """Spans and the critical path of a traced call
+
+    The trace id is the id of the generate_task_queue job of the
+    call, see ?cu.utils.tracing.summary
+    """
+    try:
+        return summary(trace_id)
+    except Exception as e:
+        return return_exception(e)
+
+
+@bottle.route('/api/profiles/<name>', method=['GET'])
+def get_task_profiles(name):
+    """Recent profiles of a task
+
+    see ?cu.utils.sampling_profiler.get_profiles
+    """
+    try:
+        return {'results': get_profiles(name)}
+    except Exception as e:
+        return return_exception(e)
+
+
+@bottle.route('/api/uploads/<md5>', method=['GET','POST'])
+def get_upload(md5):
+    """Look up an upload by the md5 (and 'size') of its content
+
+    Returns {"storage_fn": <remote storage path>}, where the path is
+    null if the content has not been uploaded yet. The path can be
+    used as an argument instead of the file.
+    """
+    try:
+        res = lookup_upload(md5 = md5,
+                            size = bottle.request.params.get('size'))
+    except Exception as e:
+        return return_exception(e)
+
+    return {'storage_fn': res}
+
+
+def _batch(method_str, submit):
+    try:
+        data = bottle.request.json
+        if not isinstance(data, dict) \
+           or not isinstance(data.get('args'), list):
+            raise RuntimeError\
+                ('expected json: {"args": [{...}, ...], '
+                 '"serve_type": "path"}')
+
+        call, docs = _request_method(method_str)
+        args_list = [_parse_args(x, docs)[0] for x in data['args']]
+        res = call_batch(method = method_str, args_list = args_list,
+                         call = call, submit = submit,
+                         serve_type = data.get('serve_type', 'path'))
+    except Exception as e:
+        return return_exception(e)
+
+    return {'results': res}
+
+
+@bottle.route('/api/batch/<method_str:path>', method=['POST'])
+def do_batch(method_str):
+    """Submit many calls of a method
+
+    Expects json: {"args": [<arguments of a call>, ...]}. The response
+    is a list with an item per call: its results (see 'serve_type'),
+    or a 'task is running' message. Repeat the request to get the
+    results of running calls.
+    """
+    return _batch(method_str, submit = True)
+
+
+@bottle.route('/api/batch_status/<method_str:path>', method=['POST'])
+def get_batch_status(method_str):
+    """As ?do_batch, but never submits calls
+
+    Calls that are neither computed nor running are reported with a
+    'task is not submitted' message.
+    """
+    return _batch(method_str, submit = False)
+
+
+def _request_args():
     args = {}
 
     if bottle.request.query:
@@ -117,26 +289,69 @@ def do_method(method_str):
     if bottle.request.files:
         args.update(_process_request_files(bottle.request.files))
 
+    return args
+
+
+def _events_timeout():
+    """Maximum duration of an event stream
+
+    gunicorn kills a 'sync' worker, if a request takes longer than
+    CONFIGS['webserver']['timeout']. Then, streams end earlier with a
+    'timeout' event.
+    """
+    res = int(CONFIGS['webserver']['events_timeout'])
+    if 'sync' == CONFIGS['webserver']['worker_class']:
+        res = min(res, int(CONFIGS['webserver']['timeout']) // 2)
+    return res
+
+
+@bottle.route('/api/events/<method_str:path>', method=['GET','POST'])
+def get_events(method_str):
+    """Stream server-sent events of a method call
+
+    Arguments are the same as for /api/<method>. See
+    ?cu.webserver.events.method_events
+    """
     try:
-        method = _method2module(method_str)
-        defaults = calldocs(method)['args']
-        defaults.update(_webserver_args)
-        args = parse_args(data = args, defaults = defaults)
+        call, docs = _request_method(method_str)
+        args, webserver_args = _parse_args(_request_args(), docs)
     except Exception as e:
         return return_exception(e)
 
-    webserver_args = {}
-    for k in _webserver_args.keys():
-        webserver_args[k] = args[k]
-        del args[k]
+    serve_type = webserver_args['serve_type']
+    if 'file' == serve_type:
+        serve_type = 'path'
+
+    bottle.response.content_type = 'text/event-stream'
+    bottle.response.set_header('Cache-Control', 'no-cache')
+    return method_events\
+        (method = method_str, args = args, call = call,
+         serve_type = serve_type,
+         timeout = _events_timeout())
 
-    return serve(call_method(method=method_str, args=args),
+
+@bottle.route('/api/<method_str:path>', method=['GET','POST'])
+def do_method(method_str):
+    try:
+        call, docs = _request_method(method_str)
+        args, webserver_args = _parse_args(_request_args(), docs)
+    except Exception as e:
+        return return_exception(e)
+
+    return serve(call_method(method=method_str, args=args,
+                             call=call),
                  **webserver_args)
 
 
+# populated before gunicorn forks, hence shared by all workers
+_preload_methods(CONFIGS['webserver']['preload_methods'])
+
 bottle.run(host=CONFIGS['webserver']['host'],
            port=CONFIGS['webserver']['port'],
            server='gunicorn',
            workers=CONFIGS['webserver']['workers'],
            max_requests=CONFIGS['webserver']['max_requests'],
-           timeout=CONFIGS['webserver']['timeout'])
+           timeout=CONFIGS['webserver']['timeout'],
+           worker_class=CONFIGS['webserver']['worker_class'],
+           threads=CONFIGS['webserver']['threads'],
+           worker_connections=CONFIGS['webserver']['worker_connections'])
@@ -17,6 +17,7 @@
 
 
 import os
+import re
 import hashlib
 
 from cu.app \
@@ -25,16 +26,39 @@ from cu.app \
 from cu.cache.cache \
     import cache_fn
 
+from cu.storage.remotestorage_path \
+    import RemoteStoragePath
+
 from cu.utils.files \
     import remove_file, get_tempfile
 
 
-def _hash_file(fn, chunk_size = 4096):
+_MD5_RE = re.compile(r'[0-9a-f]{32}')
+
+
+def _save_hashed(request_data, ofn, chunk_size = 2**20):
+    """Save uploaded data and compute its md5 in a single pass
+
+    :request_data: bottle.FileUpload
+
+    :ofn: output file path
+
+    :chunk_size: size of the read buffer
+
+    :return: md5 hex digest
+
+    """
     h = hashlib.md5()
+    src = request_data.file
+    offset = src.tell()
 
-    with open(fn, 'rb') as f:
-        for chunk in iter(lambda: f.read(chunk_size), b''):
-            h.update(chunk)
+    try:
+        with open(ofn, 'wb') as f:
+            for chunk in iter(lambda: src.read(chunk_size), b''):
+                h.update(chunk)
+                f.write(chunk)
+    finally:
+        src.seek(offset)
 
     return h.hexdigest()
 
@@ -48,14 +72,43 @@ def upload_request_data(request_data):
     ofn = get_tempfile()
 
     try:
-        request_data.save(ofn, overwrite = True)
         name = os.path.join\
-            (UPLOADS_DIR, _hash_file(ofn))
+            (UPLOADS_DIR, _save_hashed(request_data, ofn))
         return _upload_file(fn = ofn, name = name)
     finally:
         remove_file(ofn)
 
 
+def lookup_upload(md5, size = None):
+    """Find an already uploaded file by its content
+
+    Allows clients to skip uploading content the storage already has.
+    A found upload is touched, so it is not removed as unused.
+
+    :md5: md5 hex digest of the file
+
+    :size: optionally, size of the file in bytes. If given, an upload
+    of a different size is not reported
+
+    :return: remote storage path, or None
+
+    """
+    md5 = md5.lower()
+    if not _MD5_RE.fullmatch(md5):
+        raise RuntimeError("invalid md5 = {}".format(md5))
+
+    rpath = RemoteStoragePath(os.path.join(UPLOADS_DIR, md5))
+    if not rpath.in_storage():
+        return None
+
+    if size is not None and int(size) != rpath.get_size():
+        return None
+
+    # the client relies on the upload instead of sending it again
+    rpath.update_timestamp()
+    return str(rpath)
+
+
 def upload(fn = 'NA'):
     """Upload a file to a storage
 
@@ -16,10 +16,13 @@
 #
 
 
+import os
 import re
 import json
+import bottle
 import celery
 import inspect
+import logging
 import traceback
 
 from celery.result \
@@ -33,7 +36,13 @@ from cu.exceptions \
     import TASK_RUNNING
 
 from cu.app \
-    import get_Tasks_Queues, CONFIGS
+    import get_Tasks_Queues, CONFIGS, CELERY_APP
+
+from cu.utils.import_function \
+    import import_function
+
+from cu.utils.tracing \
+    import trace
 
 from cu.webserver.tasks \
     import generate_task_queue
@@ -99,14 +108,29 @@ def format_help(data):
     return '\n'.join(res)
 
 
+def serve_file(fn):
+    """Stream a local file
+
+    The file is not read into memory. bottle passes it to the
+    'wsgi.file_wrapper' (sendfile in gunicorn), and handles 'Range'
+    requests, 'Content-Length' and 'Last-Modified' headers.
+
+    :fn: path to a local file
+
+    """
+    fn = os.path.abspath(fn)
+    return bottle.static_file\
+        (os.path.basename(fn), root = os.path.dirname(fn),
+         mimetype = 'application/octet-stream')
+
+
 def serve(data, serve_type = 'file'):
     if isinstance(data, dict):
         return data
 
     if is_remote_path(data):
         if 'file' == serve_type:
-            with open(searchandget_locally(data),'rb') as f:
-                return f.read()
+            return serve_file(searchandget_locally(data))
         elif 'path' == serve_type:
             return {'storage_fn': data}
         elif 'deserialise' == serve_type:
@@ -135,6 +159,9 @@ def get_job_results(job_id, key, timeout):
         elif 'PENDING' == state \
              or 'STARTED' == state \
              or 'RETRY' == state:
+            if not timeout:
+                return {'results': {'message': 'task is running',
+                                    'state': state}}
             fn = job.wait(timeout = timeout)
         elif 'FAILURE' == state:
             res = job.result
@@ -164,45 +191,203 @@ def get_job_results(job_id, key, timeout):
     return fn
 
 
-def _method_results(method, args):
-    tasks_queues = get_Tasks_Queues()
-    job_id = tasks_queues[(method, args)]
+def _method_results(tasks_queues, key, job_id = None, timeout = None):
+    """Get results of a submitted method call
+
+    :tasks_queues: see ?cu.app.get_Tasks_Queues
+
+    :key: hashed (method, args) key of tasks_queues
+
+    :job_id: value stored in tasks_queues. If None, it is looked up
+
+    :timeout: seconds to wait for results. If None, the webserver
+    timeout is used. If 0, do not wait
+
+    """
+    if timeout is None:
+        timeout = int(CONFIGS['webserver']['timeout'])
+
+    if job_id is None:
+        job_id = tasks_queues[key]
 
     # determine if task is generate_task_queue type
     m = re.match('generate_task_queue://(.*)', job_id)
     if m:
         job_id = get_job_results\
             (m.groups()[0],
-             timeout = \
-             int(CONFIGS['webserver']['timeout']),
-             key = (method, args))
+             timeout = timeout,
+             key = key)
 
-    if isinstance(job_id, dict):
-        return job_id
+        if isinstance(job_id, dict):
+            return job_id
 
-    if isinstance(job_id, str) and is_remote_path(job_id):
-        return job_id
+        if isinstance(job_id, str) and is_remote_path(job_id):
+            return job_id
 
-    tasks_queues[(method, args)] = job_id
+        tasks_queues[key] = job_id
 
     return get_job_results\
         (job_id,
-         timeout = \
-         int(CONFIGS['webserver']['timeout']),
-         key = (method, args))
+         timeout = timeout,
+         key = key)
+
 
+def _cached_results(call, args):
+    """Look up results of a @call in the storage
+
+    :call: function decorated with @call
+
+    :args: arguments of the call
+
+    :return: remote storage path, or None
+
+    """
+    if not hasattr(call, 'cached_result'):
+        return None
+
+    try:
+        return call.cached_result(**args)
+    except Exception as e:
+        logging.warning("cache lookup failed for {}: {}: {}"\
+                        .format(call.__name__, type(e).__name__, e))
+        return None
+
+
+def _cached_results_many(call, args_list, update_timestamp = True):
+    """Look up results of many calls of a @call in the storage
+
+    see ?_cached_results
+
+    :update_timestamp: if update timestamps of found results
+
+    :return: list of remote storage paths or None
+    """
+    if not hasattr(call, 'cached_results'):
+        return [None] * len(args_list)
+
+    try:
+        return call.cached_results\
+            (args_list, update_timestamp = update_timestamp)
+    except Exception as e:
+        logging.warning("cache lookup failed for {}: {}: {}"\
+                        .format(call.__name__, type(e).__name__, e))
+        return [None] * len(args_list)
+
+
+def call_method(method, args, call = None):
+    """Get results of a method call
+
+    Calls that are not queued yet are looked up in the storage, and
+    cached results of a @call are returned directly. Otherwise the
+    call is sent to a worker, see
+    ?cu.webserver.tasks.generate_task_queue
+
+    If tracing is enabled (see CONFIGS['tracing']), the call is traced
+    with the id of the generate_task_queue job, see
+    ?cu.utils.tracing.summary
+
+    :method: method path
+
+    :args: method arguments
+
+    :call: function of the method. If None, it is imported
+
+    """
+    if call is None:
+        call = import_function(method.replace('/','.'))
 
-def call_method(method, args):
     tasks_queues = get_Tasks_Queues()
+    key = tasks_queues.hashed((method, args))
+    job_id = tasks_queues.get(key)
+
+    if job_id is None:
+        res = _cached_results(call, args)
+        if res is not None:
+            return res
+
+        try:
+            with trace('call_method', method = method) as trace_id:
+                job = generate_task_queue.apply_async\
+                    ((method, args), task_id = trace_id)
+            job_id = "generate_task_queue://{}".format(job.task_id)
+            tasks_queues[key] = job_id
+        except Exception as e:
+            return return_exception(e)
 
-    if (method, args) in tasks_queues:
-        return _method_results(method, args)
+    return _method_results(tasks_queues, key, job_id = job_id)
+
+
+def _batch_item(tasks_queues, key, job_id):
+    if job_id is None:
+        return {'results': {'message': 'task is not submitted'}}
 
     try:
-        job = generate_task_queue.delay(method, args)
-        tasks_queues[(method, args)] = \
-            "generate_task_queue://{}".format(job.task_id)
+        return _method_results(tasks_queues, key,
+                               job_id = job_id, timeout = 0)
     except Exception as e:
         return return_exception(e)
 
-    return _method_results(method, args)
+
+def call_batch(method, args_list, call = None,
+               submit = True, serve_type = 'path'):
+    """Get results of many calls of a method
+
+    Identical calls are computed once. Tasks_Queues is queried and
+    updated in a single round trip. Calls that are not queued are
+    looked up in the storage at once, and cached results of a @call
+    are returned directly. New calls are sent to the broker over one
+    connection. Nothing waits for the results.
+
+    :method: method path
+
+    :args_list: list of method arguments
+
+    :call: function of the method. If None, it is imported
+
+    :submit: if False, only report the status of the calls.
+    Timestamps of cached results are not updated then
+
+    :serve_type: see ?cu.webserver.utils.serve. 'file' is not allowed
+
+    :return: list of results in the order of args_list
+
+    """
+    if 'file' == serve_type:
+        raise RuntimeError("serve_type = 'file' is not supported "
+                           "for batches!")
+
+    if call is None:
+        call = import_function(method.replace('/','.'))
+
+    tasks_queues = get_Tasks_Queues()
+    keys = [tasks_queues.hashed((method, args)) for args in args_list]
+    items = dict(zip(keys, args_list))
+
+    job_ids = dict(zip(items, tasks_queues.get_many(list(items))))
+
+    res = {}
+    missing = [key for key in items if job_ids[key] is None]
+    # reporting the status does not count as a use of the results
+    for key, x in zip(missing, _cached_results_many\
+                      (call, [items[key] for key in missing],
+                       update_timestamp = submit)):
+        if x is not None:
+            res[key] = x
+
+    pending = [key for key in items if key not in res]
+    new = [key for key in pending if job_ids[key] is None]
+    if submit and new:
+        with CELERY_APP.producer_or_acquire() as producer:
+            for key in new:
+                with trace('call_method', method = method) as trace_id:
+                    job = generate_task_queue.apply_async\
+                        ((method, items[key]), producer = producer,
+                         task_id = trace_id)
+                job_ids[key] = "generate_task_queue://{}"\
+                    .format(job.task_id)
+        tasks_queues.set_many([(key, job_ids[key]) for key in new])
+
+    for key in pending:
+        res[key] = _batch_item(tasks_queues, key, job_ids[key])
+
+    return [serve(res[key], serve_type = serve_type) for key in keys]